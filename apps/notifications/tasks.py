@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from celery import shared_task
+
+from core.celery import LogErrorsTask
+from .models import OutgoingEmail
+
+
+def schedule_retry(email, error, now):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX['MAX_ATTEMPTS']:
+        email.status = 'FAILED'
+    else:
+        delay = settings.EMAIL_OUTBOX['RETRY_DELAY'] * 2 ** (email.attempts - 1)
+        email.next_attempt_at = now + timedelta(seconds=delay)
+
+
+def send_one(connection, email, now):
+    message = EmailMessage(
+        subject=email.subject, body=email.message,
+        from_email=email.from_email, to=email.recipients,
+        connection=connection)
+    try:
+        connection.send_messages([message])
+    except Exception as exc:
+        schedule_retry(email, exc, now)
+        return 0
+    email.status = 'SENT'
+    email.sent_at = now
+    return 1
+
+
+def claim_batch(now):
+    """
+    Hides a batch from other workers until CLAIM_TIMEOUT, so the emails
+    are sent without holding row locks. A worker that dies mid-batch
+    leaves the rest to be picked up again after the timeout.
+    """
+    claimed_until = now + timedelta(
+        seconds=settings.EMAIL_OUTBOX['CLAIM_TIMEOUT'])
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects
+                      .select_for_update(skip_locked=True)
+                      .filter(status='PENDING', next_attempt_at__lte=now)
+                      .order_by('next_attempt_at')
+                      [:settings.EMAIL_OUTBOX['BATCH_SIZE']])
+        (OutgoingEmail.objects
+         .filter(pk__in=[email.pk for email in emails])
+         .update(next_attempt_at=claimed_until))
+    return emails
+
+
+def deliver(emails, now):
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        for email in emails:
+            schedule_retry(email, exc, now)
+        return sent
+    try:
+        for email in emails:
+            sent += send_one(connection, email, now)
+    finally:
+        connection.close()
+    return sent
+
+
+@shared_task(base=LogErrorsTask)
+def send_outbox():
+    """ Delivers a batch of pending emails over one SMTP connection """
+    now = timezone.now()
+    emails = claim_batch(now)
+    if not emails:
+        return 0
+
+    try:
+        return deliver(emails, now)
+    finally:
+        # Delivered emails are recorded even if the batch is interrupted
+        OutgoingEmail.objects.bulk_update(emails, (
+            'status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'))
+
+
+@shared_task(base=LogErrorsTask)
+def purge_sent_emails():
+    """ Failed emails are kept for inspection """
+    sent_before = timezone.now() - timedelta(
+        seconds=settings.EMAIL_OUTBOX['KEEP_SENT'])
+    OutgoingEmail.objects.filter(
+        status='SENT', sent_at__lte=sent_before).delete()
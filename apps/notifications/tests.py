@@ -0,0 +1,72 @@
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import OutgoingEmail
+from .tasks import claim_batch, purge_sent_emails, send_outbox
+from .utils import enqueue_email
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        for i in range(3):
+            enqueue_email('Test subject', 'Test message', [f'{i}@test.com'])
+
+    def test_batch_is_sent_over_one_connection(self):
+        with mock.patch('apps.notifications.tasks.get_connection',
+                        wraps=mail.get_connection) as get_connection:
+            self.assertEqual(send_outbox(), 3)
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            OutgoingEmail.objects.filter(status='SENT').count(), 3)
+        self.assertEqual(send_outbox(), 0)
+
+    def test_failed_emails_are_retried_with_backoff(self):
+        with self.settings(EMAIL_OUTBOX={
+                **settings.EMAIL_OUTBOX, 'MAX_ATTEMPTS': 2}):
+            with mock.patch('django.core.mail.backends.locmem.EmailBackend'
+                            '.send_messages', side_effect=SMTPException):
+                send_outbox()
+                email = OutgoingEmail.objects.first()
+                self.assertEqual(email.status, 'PENDING')
+                self.assertEqual(email.attempts, 1)
+                self.assertGreater(email.next_attempt_at, timezone.now())
+
+                self.assertEqual(send_outbox(), 0)
+                OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+                send_outbox()
+
+        self.assertEqual(
+            OutgoingEmail.objects.filter(status='FAILED').count(), 3)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_claimed_batch_is_skipped_until_timeout(self):
+        self.assertEqual(len(claim_batch(timezone.now())), 3)
+        self.assertEqual(send_outbox(), 0)
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_outbox(), 3)
+
+    def test_delivered_emails_are_recorded_if_interrupted(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend'
+                        '.close', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                send_outbox()
+        self.assertEqual(
+            OutgoingEmail.objects.filter(status='SENT').count(), 3)
+
+    def test_sent_emails_are_purged(self):
+        send_outbox()
+        (OutgoingEmail.objects
+         .filter(pk=OutgoingEmail.objects.first().pk)
+         .update(sent_at=timezone.now() - timedelta(days=30)))
+        enqueue_email('Test subject', 'Test message', ['3@test.com'])
+        purge_sent_emails()
+        self.assertEqual(OutgoingEmail.objects.count(), 3)
+        self.assertEqual(
+            OutgoingEmail.objects.filter(status='PENDING').count(), 1)
@@ -0,0 +1,13 @@
+from django.conf import settings
+
+from .models import OutgoingEmail
+
+
+def enqueue_email(subject, message, recipient_list, from_email=None):
+    """ Stores a rendered email, the outbox worker delivers it in a batch """
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        message=message,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        recipients=list(recipient_list),
+    )
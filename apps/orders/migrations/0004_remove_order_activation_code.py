@@ -0,0 +1,51 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:54
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+# Orders wait for a confirmation code while pending and for a completion
+# code once delivered, codes left in other statuses can not be used
+PURPOSES = {'PENDING': 'ORDER_CONFIRM', 'DELIVER': 'ORDER_COMPLETE'}
+
+
+def move_activation_codes(apps, schema_editor):
+    """ Codes already sent by email keep working until they expire """
+    Order = apps.get_model('orders', 'Order')
+    OneTimeToken = apps.get_model('users', 'OneTimeToken')
+
+    db_alias = schema_editor.connection.alias
+    now = timezone.now()
+    orders = (Order.objects
+              .using(db_alias)
+              .filter(status__in=PURPOSES)
+              .exclude(activation_code='')
+              .values_list('id', 'activation_code', 'status'))
+    tokens = []
+    for order_id, code, status in orders.iterator():
+        purpose = PURPOSES[status]
+        tokens.append(OneTimeToken(
+            purpose=purpose, target_id=order_id,
+            code_hash=hashlib.sha256(code.encode()).hexdigest(),
+            expires_at=now + settings.ONE_TIME_TOKEN_TTL[purpose]))
+    OneTimeToken.objects.using(db_alias).bulk_create(
+        tokens, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_keyset_index'),
+        ('users', '0002_one_time_tokens'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_activation_codes,
+                             migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='order',
+            name='activation_code',
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:08
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+ACTIVE_STATUSES = ('PENDING', 'PROCESS', 'SHIP', 'DELIVER')
+
+
+def cancel_duplicate_orders(apps, schema_editor):
+    """ Keeps the first active order of every user and product pair """
+    Order = apps.get_model('orders', 'Order')
+
+    active = (Order.objects
+              .using(schema_editor.connection.alias)
+              .filter(status__in=ACTIVE_STATUSES))
+    duplicates = (active
+                  .values('user', 'product')
+                  .annotate(first_id=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for duplicate in duplicates.iterator():
+        (active
+         .filter(user=duplicate['user'], product=duplicate['product'])
+         .exclude(id=duplicate['first_id'])
+         .update(status='CANCEL'))
+
+
+def mark_ordered_products_sold(apps, schema_editor):
+    """ Products with an active order can't be ordered by anyone else """
+    Order = apps.get_model('orders', 'Order')
+    Product = apps.get_model('products', 'Product')
+
+    (Product.objects
+     .using(schema_editor.connection.alias)
+     .filter(pk__in=(Order.objects
+                     .filter(status__in=ACTIVE_STATUSES)
+                     .values('product')))
+     .update(is_sold=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_remove_order_activation_code'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_duplicate_orders,
+                             migrations.RunPython.noop),
+        migrations.RunPython(mark_ordered_products_sold,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ('PENDING', 'PROCESS', 'SHIP', 'DELIVER'))), fields=('user', 'product'), name='unique_active_order'),
+        ),
+    ]
@@ -5,6 +5,8 @@ from apps.products.models import Product
 
 User = get_user_model()
 
+ACTIVE_STATUSES = ('PENDING', 'PROCESS', 'SHIP', 'DELIVER')
+
 
 class Order(models.Model):
     STATUS_CHOISES = (
@@ -15,6 +17,8 @@ class Order(models.Model):
         ('COMPLETE', 'Completed'),
         ('CANCEL', 'Canceled')
     )
+    ACTIVE_STATUSES = ACTIVE_STATUSES
+    FINISHED_STATUSES = ('CANCEL', 'COMPLETE')
 
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='orders')
@@ -25,11 +29,18 @@ class Order(models.Model):
     status = models.CharField(
         max_length=9, choices=STATUS_CHOISES, default='PENDING')
     address = models.CharField(max_length=128)
-    activation_code = models.CharField(max_length=10)
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['-created_at', '-id']),
+        ]
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'product'],
+            condition=models.Q(status__in=ACTIVE_STATUSES),
+            name='unique_active_order')]
 
     def __str__(self) -> str:
         return f'Заказ от {self.user} на {self.product}'
@@ -1,12 +1,29 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
+from core.metrics import TimedListSerializer, TimedSerializerMixin
+from core.sparse import SparseFieldsMixin
+from apps.products.comments import attach_first_comments
+from apps.products.models import Product
+from apps.products.signals import bump_product_versions
 from apps.products.serializers import ProductSerializer
+from apps.users.models import OneTimeToken
 from .models import Order
 from .tasks import send_order_created, send_updated_status, send_cancel_status
-from .utils import create_activation_code
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderListSerializer(TimedListSerializer):
+    """ Loads the first comments of all ordered products in one query """
+
+    def to_representation(self, data):
+        orders = list(data.all() if hasattr(data, 'all') else data)
+        if self.child.sparse.expands('product'):
+            attach_first_comments([order.product for order in orders])
+        return super().to_representation(orders)
+
+
+class OrderSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                      serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
@@ -14,28 +31,47 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = (
             'id', 'user', 'product', 'created_at',
-            'updated_at', 'status', 'activation_code')
+            'updated_at', 'status')
+        list_serializer_class = OrderListSerializer
 
     def validate(self, attrs):
         user = attrs['user']
         product = self.context['product']
         if user == product.user:
             raise serializers.ValidationError("You can't order from yourserlf")
-        elif Order.objects.filter(user=user, product=product).exists():
-            raise serializers.ValidationError("You can't order twice")
         attrs['product'] = product
         return attrs
 
     def create(self, validated_data):
-        order = super().create(validated_data)
-        create_activation_code(order)
-        send_order_created.delay(order.id)
+        """ The product row lock serializes buyers, the first one marks
+        the product as sold until the order is canceled """
+        product_id = validated_data['product'].pk
+        with transaction.atomic():
+            is_sold = (Product.objects
+                       .select_for_update()
+                       .values_list('is_sold', flat=True)
+                       .get(pk=product_id))
+            if is_sold:
+                raise serializers.ValidationError('Product is already sold')
+            try:
+                with transaction.atomic():
+                    order = super().create(validated_data)
+            except IntegrityError:
+                raise serializers.ValidationError("You can't order twice")
+            Product.objects.filter(pk=product_id).update(is_sold=True)
+            bump_product_versions(product_id)
+            code = OneTimeToken.objects.issue('ORDER_CONFIRM', order.id)
+            send_order_created.delay_on_commit(order.id, code)
         return order
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        rep['product'] = ProductSerializer(instance.product).data
-        rep['user'] = instance.user.username
+        if self.sparse.expands('product'):
+            rep['product'] = ProductSerializer(instance.product).data
+        if self.sparse.expands('user'):
+            rep['user'] = instance.user.username
+        elif self.sparse.wants('user'):
+            rep['user'] = instance.user_id
         return rep
 
 
@@ -63,9 +99,12 @@ class OrderUpdateStatus(serializers.ModelSerializer):
         return attrs
 
     def save(self, **kwargs):
-        order = super().save(**kwargs)
-        send_updated_status.delay(order.id)
-        order.save()
+        with transaction.atomic():
+            order = super().save(**kwargs)
+            code = None
+            if order.status == 'DELIVER':
+                code = OneTimeToken.objects.issue('ORDER_COMPLETE', order.id)
+            send_updated_status.delay_on_commit(order.id, code)
         return order
 
 
@@ -81,9 +120,18 @@ class OrderCancelSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 {'detail': 'You cannot cancel finished order'})
 
-        send_cancel_status.delay(order.id, self.context['request'].user.id)
-        order.status = 'CANCEL'
-        order.save()
+        with transaction.atomic():
+            order.status = 'CANCEL'
+            order.save()
+            # The product can be ordered again
+            Product.objects.filter(pk=order.product_id).update(is_sold=False)
+            bump_product_versions(order.product_id)
+            # Links already emailed must not revive the order
+            OneTimeToken.objects.filter(
+                purpose__in=('ORDER_CONFIRM', 'ORDER_COMPLETE'),
+                target_id=order.id).delete()
+        send_cancel_status.delay_on_commit(
+            order.id, self.context['request'].user.id)
 
 
 class OrderConfirmSerializer(serializers.ModelSerializer):
@@ -93,17 +141,20 @@ class OrderConfirmSerializer(serializers.ModelSerializer):
 
     def __init__(self, instance=None, data=..., **kwargs):
         super().__init__(instance, data, **kwargs)
-        order = self.instance
         confirm_on = self.context['confirm_on']
 
-        if order.activation_code != self.context['activation_code']:
-            raise serializers.ValidationError(
-                {'detail': 'Activation code is not correct'})
-
-        order.activation_code = ''
-
-        if confirm_on == 'PENDING':
-            order.status = 'PROCESS'
-        else:
-            order.status = 'COMPLETE'
-        order.save()
+        with transaction.atomic():
+            # Locked, so a concurrent cancel is seen before the update
+            order = (Order.objects
+                     .select_for_update()
+                     .get(pk=self.instance.pk))
+            if order.status != confirm_on:
+                raise serializers.ValidationError(
+                    {'detail': f'Order is {order.status.lower()}'})
+
+            if confirm_on == 'PENDING':
+                order.status = 'PROCESS'
+            else:
+                order.status = 'COMPLETE'
+            order.save()
+        self.instance.status = order.status
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import bump_versions, version_key
+from apps.products.signals import update_counters
+from .models import Order
+
+
+def bump_order_versions(order):
+    """ Orders are cached per user, for both the buyer and the seller """
+    bump_versions([version_key('orders', order.user_id),
+                   version_key('orders', order.product.user_id)])
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    if created:
+        update_counters(instance.product_id, orders_count=1)
+    bump_order_versions(instance)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    update_counters(instance.product_id, orders_count=-1)
+    bump_order_versions(instance)
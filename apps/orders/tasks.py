@@ -1,81 +1,74 @@
-from django.core.mail import send_mail
-from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.conf import settings
 from celery import shared_task
 
 from .models import Order
-from .utils import create_activation_code
 from core.celery import LogErrorsTask
-from apps.products.models import Product
+from apps.notifications.utils import enqueue_email
 
-User = get_user_model()
 
+def get_order(order_id):
+    """ The order with its buyer, product and seller in one query """
+    return (Order.objects
+            .select_related('user', 'product__user')
+            .get(pk=order_id))
 
-@shared_task(base=LogErrorsTask)
-def send_updated_status(order_id):
-    order = Order.objects.get(pk=order_id)
+
+@shared_task(base=LogErrorsTask, max_queries=2)
+def send_updated_status(order_id, activation_code=None):
+    order = get_order(order_id)
     user = order.user
     subject = 'Order status update'
     message = f"""
     Hello {user.username},
     There's status update on your {order.product.title} it is now {order.get_status_display()}"""
-    if order.status == 'DELIVER':
-        create_activation_code(order)
-        activation_code = order.activation_code
+    if activation_code:
         complete_link = f"{settings.BASE_URL}{reverse('complete', args=[activation_code])}"
         message += f"""
     Proceed this link to complete your order {complete_link}"""
 
-    send_mail(
+    enqueue_email(
         subject=subject,
         message=message,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=[user.email],
-        fail_silently=False
+        recipient_list=[user.email]
     )
 
 
-@shared_task(base=LogErrorsTask)
+@shared_task(base=LogErrorsTask, max_queries=2)
 def send_cancel_status(order_id, user_id):
-    order = Order.objects.get(pk=order_id)
-    user = User.objects.get(pk=user_id)
+    order = get_order(order_id)
+    author, owner = order.user, order.product.user
     subject = 'Order was canceled'
-    if user == order.user:
+    if user_id == author.id:
         """ Check if user is Author """
         message = f"""
-    Hello {order.product.user.username},
-    {user.username} have canceled your order on {order.product.title}
+    Hello {owner.username},
+    {author.username} have canceled your order on {order.product.title}
     """
 
-        send_mail(
+        enqueue_email(
             subject=subject,
             message=message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[order.product.user.email],
-            fail_silently=False
+            recipient_list=[owner.email]
         )
 
-    elif user == order.product.user:
+    elif user_id == owner.id:
         """ Checks if user is Owner """
         message = f"""
-    Hello {order.user.username},
+    Hello {author.username},
     The owner of the {order.product.title} have cancelled your order
     """
 
-        send_mail(
+        enqueue_email(
             subject=subject,
             message=message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[order.user.email],
-            fail_silently=False
+            recipient_list=[author.email]
         )
 
 
-@shared_task(base=LogErrorsTask)
-def send_order_created(order_id):
-    order = Order.objects.get(pk=order_id)
-    activation_code = order.activation_code
+@shared_task(base=LogErrorsTask, max_queries=2)
+def send_order_created(order_id, activation_code):
+    order = get_order(order_id)
     user = order.product.user
     confirmation_link = f"{settings.BASE_URL}{reverse('confirm', args=[activation_code])}"
     subject = f'New order for {order.product.title}'
@@ -83,10 +76,8 @@ def send_order_created(order_id):
     Hello {user.username},
     User {order.user.username} have ordered your {order.product.title}
     Proceed this link to confirm {confirmation_link}"""
-    send_mail(
+    enqueue_email(
         subject=subject,
         message=message,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=[user.email],
-        fail_silently=False
+        recipient_list=[user.email]
     )
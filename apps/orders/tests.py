@@ -1,11 +1,16 @@
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
 from .models import Order
-from .utils import create_activation_code
-from apps.products.models import Product
+from .tasks import send_order_created, send_cancel_status, send_updated_status
+from apps.notifications.models import OutgoingEmail
+from apps.users.models import OneTimeToken
+from apps.products.models import Comment, Like, Product
 
 User = get_user_model()
 
@@ -35,6 +40,110 @@ class OrderTestCase(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_notifications_are_sent_after_commit(self):
+        self.order1.delete()
+        self.client.force_authenticate(user=self.user2)
+        url = ('/products/%s/order/' % self.product.id)
+        with mock.patch.object(send_order_created, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, {'address': 'Test address 3'})
+                delay.assert_not_called()
+        order = Order.objects.get()
+        delay.assert_called_once_with(order.id, mock.ANY)
+
+        with mock.patch.object(send_cancel_status, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete('/orders/%s/' % order.id)
+        delay.assert_called_once_with(order.id, self.user2.id)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'CANCEL')
+
+    def test_order_again_after_cancel(self):
+        self.client.force_authenticate(user=self.user2)
+        url = ('/products/%s/order/' % self.product.id)
+        data = {'address': 'Test address 3'}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        Order.objects.filter(pk=self.order1.pk).update(status='CANCEL')
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 2)
+
+        self.client.delete('/orders/%s/' % Order.objects.latest('id').id)
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.is_sold)
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_second_buyer_is_rejected(self):
+        self.order1.delete()
+        buyer = User.objects.create_user(
+            username='testuser3', password='testpass123',
+            email='test3@test.com')
+        url = ('/products/%s/order/' % self.product.id)
+        self.client.force_authenticate(user=self.user2)
+        response = self.client.post(url, {'address': 'Test address 2'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.is_sold)
+
+        self.client.force_authenticate(user=buyer)
+        response = self.client.post(url, {'address': 'Test address 3'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_sold_product_can_not_be_ordered(self):
+        self.order1.delete()
+        Product.objects.filter(pk=self.product.pk).update(is_sold=True)
+        self.client.force_authenticate(user=self.user2)
+        response = self.client.post(
+            '/products/%s/order/' % self.product.id, {'address': 'Test'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_idempotency_key_replays_order(self):
+        cache.clear()
+        self.order1.delete()
+        self.client.force_authenticate(user=self.user2)
+        url = ('/products/%s/order/' % self.product.id)
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'order-1'}
+        first = self.client.post(url, {'address': 'Test'}, **headers)
+        second = self.client.post(url, {'address': 'Test'}, **headers)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+        response = self.client.post(url, {'address': 'Other'}, **headers)
+        self.assertEqual(response.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_idempotency_key_replays_response_stored_before_lock(self):
+        cache.clear()
+        self.order1.delete()
+        self.client.force_authenticate(user=self.user2)
+        url = ('/products/%s/order/' % self.product.id)
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'order-1'}
+        first = self.client.post(url, {'address': 'Test'}, **headers)
+
+        # The retry read the key just before the first request stored it
+        cache_get = cache.get
+        missed = []
+
+        def get(key, *args):
+            if key.startswith('idempotency:') and not missed:
+                missed.append(key)
+                return None
+            return cache_get(key, *args)
+
+        with mock.patch('core.idempotency.cache.get', side_effect=get):
+            second = self.client.post(url, {'address': 'Test'}, **headers)
+        self.assertEqual(len(missed), 1)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(Order.objects.count(), 1)
+
     def test_update_order_status(self):
         self.client.force_authenticate(user=self.user1)
         url = ('/orders/%s/' % self.order1.id)
@@ -77,9 +186,10 @@ class OrderCompleteTestCase(APITestCase):
         self.order1 = Order.objects.create(
             user=self.user2, product=self.product,
             address='Test address 1', status='DELIVER')
-        create_activation_code(self.order1)
-        self.url_complete = reverse('complete', args=[self.order1.activation_code])
-        self.url_confirm = reverse('confirm', args=[self.order1.activation_code])
+        self.url_complete = reverse('complete', args=[
+            OneTimeToken.objects.issue('ORDER_COMPLETE', self.order1.id)])
+        self.url_confirm = reverse('confirm', args=[
+            OneTimeToken.objects.issue('ORDER_CONFIRM', self.order1.id)])
 
     def test_order_complete(self):
         self.client.force_authenticate(user=self.user2)
@@ -87,12 +197,154 @@ class OrderCompleteTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.order1.refresh_from_db()
         self.assertEqual(self.order1.status, 'COMPLETE')
-        self.assertEqual(self.order1.activation_code, '')
+        self.assertEqual(self.client.get(self.url_complete).status_code,
+                         status.HTTP_404_NOT_FOUND)
 
     def test_order_confirm(self):
+        Order.objects.filter(pk=self.order1.pk).update(status='PENDING')
         self.client.force_authenticate(user=self.user1)
         response = self.client.get(self.url_confirm)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.order1.refresh_from_db()
         self.assertEqual(self.order1.status, 'PROCESS')
-        self.assertEqual(self.order1.activation_code, '')
+        self.assertFalse(OneTimeToken.objects.filter(
+            purpose='ORDER_CONFIRM').exists())
+
+    def test_order_confirm_requires_pending_order(self):
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.get(self.url_confirm)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.order1.refresh_from_db()
+        self.assertEqual(self.order1.status, 'DELIVER')
+
+    def test_order_confirm_after_cancel(self):
+        Order.objects.filter(pk=self.order1.pk).update(status='PENDING')
+        self.client.force_authenticate(user=self.user2)
+        self.client.delete('/orders/%s/' % self.order1.id)
+        self.assertFalse(OneTimeToken.objects.filter(
+            target_id=self.order1.id).exists())
+        response = self.client.post(
+            '/products/%s/order/' % self.product.id,
+            {'address': 'Test address 2'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(self.url_confirm)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.order1.refresh_from_db()
+        self.assertEqual(self.order1.status, 'CANCEL')
+        self.assertEqual(Order.objects.filter(
+            status__in=Order.ACTIVE_STATUSES).count(), 1)
+
+
+class OrderListTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(
+            username='seller', password='testpass123', email='seller@test.com')
+        self.buyer = User.objects.create_user(
+            username='buyer', password='testpass123', email='buyer@test.com')
+        self.other = User.objects.create_user(
+            username='other', password='testpass123', email='other@test.com')
+        self.product = Product.objects.create(
+            title='Test Product', description='Test description',
+            price=10, user=self.seller)
+        self.active = Order.objects.create(
+            user=self.buyer, product=self.product, address='Test address')
+        self.finished = Order.objects.create(
+            user=self.buyer, product=self.product,
+            address='Test address', status='COMPLETE')
+        Order.objects.create(
+            user=self.other, product=self.product, address='Test address')
+
+    def test_active_and_history(self):
+        self.client.force_authenticate(user=self.buyer)
+        response = self.client.get('/orders/active/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [order['id'] for order in response.data['results']],
+            [self.active.id])
+        response = self.client.get('/orders/history/')
+        self.assertEqual(
+            [order['id'] for order in response.data['results']],
+            [self.finished.id])
+
+    def test_owner_orders(self):
+        self.client.force_authenticate(user=self.seller)
+        with self.assertNumQueries(3):
+            response = self.client.get('/accounts/orders/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+
+        self.client.force_authenticate(user=self.buyer)
+        response = self.client.get('/accounts/orders/?page=1')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_owner_orders_without_expanded_product(self):
+        self.client.force_authenticate(user=self.seller)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/accounts/orders/?fields=status,product&expand=none')
+        self.assertEqual(response.data['results'][0], {
+            'id': self.other.orders.get().id,
+            'status': 'PENDING',
+            'product': self.product.id})
+
+    def test_active_cache_is_invalidated_by_status_change(self):
+        self.client.force_authenticate(user=self.buyer)
+        response = self.client.get('/orders/active/')
+        self.assertEqual(response.data['results'][0]['status'], 'PENDING')
+
+        self.client.force_authenticate(user=self.seller)
+        self.client.patch(f'/orders/{self.active.id}/', {'status': 'SHIP'})
+        self.client.force_authenticate(user=self.buyer)
+        response = self.client.get('/orders/active/')
+        self.assertEqual(response.data['results'][0]['status'], 'SHIP')
+
+    def test_order_cache_is_invalidated_by_product_change(self):
+        self.client.force_authenticate(user=self.buyer)
+        response = self.client.get(f'/orders/{self.active.id}/')
+        self.assertEqual(response.data['product']['likes'], 0)
+        self.assertEqual(response.data['product']['comments_count'], 0)
+
+        Like.objects.create(user=self.other, product=self.product)
+        Comment.objects.create(
+            user=self.other, product=self.product, text='Test comment')
+        response = self.client.get(f'/orders/{self.active.id}/')
+        self.assertEqual(response.data['product']['likes'], 1)
+        self.assertEqual(response.data['product']['comments_count'], 1)
+        response = self.client.get('/orders/active/')
+        self.assertEqual(
+            response.data['results'][0]['product']['comments_count'], 1)
+
+
+class OrderTasksTestCase(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(
+            username='seller', password='testpass123', email='seller@test.com')
+        self.buyer = User.objects.create_user(
+            username='buyer', password='testpass123', email='buyer@test.com')
+        self.product = Product.objects.create(
+            title='Test Product', description='Test description',
+            price=10, user=self.seller)
+        self.order = Order.objects.create(
+            user=self.buyer, product=self.product,
+            address='Test address', status='DELIVER')
+
+    def test_tasks_stay_within_query_budget(self):
+        with self.assertNumQueries(2):
+            send_order_created(self.order.id, 'confirm-code')
+        with self.assertNumQueries(2):
+            send_updated_status(self.order.id, 'complete-code')
+        with self.assertNumQueries(2):
+            send_cancel_status(self.order.id, self.buyer.id)
+        self.assertEqual(
+            list(OutgoingEmail.objects.values_list('recipients', flat=True)),
+            [['seller@test.com'], ['buyer@test.com'], ['seller@test.com']])
+        self.assertIn('complete-code', OutgoingEmail.objects.get(
+            recipients=['buyer@test.com']).message)
+
+    def test_query_budget_is_reported(self):
+        with mock.patch.object(send_cancel_status, 'max_queries', 0):
+            with self.assertLogs('main', 'WARNING') as logs:
+                send_cancel_status(self.order.id, self.seller.id)
+        self.assertIn('made 2 queries, budget is 0', logs.output[0])
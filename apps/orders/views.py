@@ -1,24 +1,52 @@
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie
+from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework import generics, mixins, viewsets, status
 
+from core.cache import cache_response, version_key
+from core.pagination import KeysetPagination
+from core.routers import ReplicaReadMixin
+from core.sparse import SparseFieldset
+from apps.users.models import OneTimeToken
 from .models import Order
 from .serializers import (OrderSerializer, OrderUpdateStatus,
                           OrderCancelSerializer, OrderConfirmSerializer)
 from .permissions import IsAuthorOrOwner, IsOwner, IsAuthor
 
 
-class OrderViewSet(mixins.RetrieveModelMixin,
+def user_orders_version(view, request, *args, **kwargs):
+    """ Orders embed their products, so any product change counts """
+    return [version_key('orders', request.user.pk), version_key('products')]
+
+
+def orders_with_relations(sparse=None):
+    """ Users are always joined for the permission checks, product
+    categories are loaded only for an expanded product """
+    queryset = (Order.objects
+                .select_related('product__user', 'user')
+                .order_by('-created_at', '-id'))
+    if (sparse or SparseFieldset()).expands('product'):
+        queryset = queryset.prefetch_related('product__categories')
+    return queryset
+
+
+class OrderViewSet(ReplicaReadMixin,
+                   mixins.RetrieveModelMixin,
                    mixins.DestroyModelMixin,
                    viewsets.GenericViewSet):
-    queryset = Order.objects.all()
+    pagination_class = KeysetPagination
+    replica_actions = ('retrieve', 'active', 'history')
+
+    def get_queryset(self):
+        return orders_with_relations(
+            SparseFieldset.from_request(self.request))
 
     def get_permissions(self):
-        if self.request.method == 'PATCH':
+        if self.action in ('active', 'history'):
+            return (IsAuthenticated(),)
+        elif self.request.method == 'PATCH':
             return (IsOwner(),)
         else:
             return (IsAuthorOrOwner(),)
@@ -30,10 +58,9 @@ class OrderViewSet(mixins.RetrieveModelMixin,
             return OrderCancelSerializer
         return OrderSerializer
     
-    @method_decorator(vary_on_cookie)
-    @method_decorator(cache_page(60*60))
-    def dispatch(self, request, *args, **kwargs):
-        return super().dispatch(request, *args, **kwargs)
+    @cache_response(user_orders_version)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def partial_update(self, request, *args, **kwargs):
         order = self.get_object()
@@ -49,47 +76,53 @@ class OrderViewSet(mixins.RetrieveModelMixin,
         return Response({'message': f'Order on {order.product.title} was canceled'})
 
     def get_author_orders(self, request):
-        author_orders = [order for order in self.get_queryset()
-                         if order.user == request.user]
-        return author_orders
+        return self.get_queryset().filter(user=request.user)
+
+    def list_orders(self, queryset):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(['GET'], detail=False)
+    @cache_response(user_orders_version)
     def active(self, request, pk=None):
-        active_orders = [order for order in self.get_author_orders(request)
-                         if order.status not in ('CANCEL', 'COMPLETE')]
-
-        serializer = self.get_serializer(active_orders, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        active_orders = (self.get_author_orders(request)
+                         .filter(status__in=Order.ACTIVE_STATUSES))
+        return self.list_orders(active_orders)
 
     @action(['GET'], detail=False)
+    @cache_response(user_orders_version)
     def history(self, request, pk=None):
-        active_orders = [order for order in self.get_author_orders(request)
-                         if order.status in ('CANCEL', 'COMPLETE')]
-
-        serializer = self.get_serializer(active_orders, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        finished_orders = (self.get_author_orders(request)
+                           .filter(status__in=Order.FINISHED_STATUSES))
+        return self.list_orders(finished_orders)
 
 
 class OrderOwnerList(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = (IsAuthenticated,)
-    queryset = Order.objects.all()
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return (orders_with_relations(
+                    SparseFieldset.from_request(self.request))
+                .filter(product__user=self.request.user))
 
-    def list(self, request, *args, **kwargs):
-        owned_orders = [order for order in self.get_queryset()
-                        if order.product.user == request.user]
 
-        serializer = self.get_serializer(owned_orders, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+def consume_order_code(purpose, activation_code):
+    order_id = OneTimeToken.objects.consume(purpose, activation_code)
+    if order_id is None:
+        raise NotFound('Activation code is not correct')
+    return get_object_or_404(
+        Order.objects.select_related('product'), pk=order_id)
 
 
 class OrderConfirm(generics.RetrieveAPIView):
     serializer_class = OrderConfirmSerializer
 
     def get(self, request, activation_code):
-        order = Order.objects.get(activation_code=activation_code)
-        self.get_serializer(
-            order, context={'confirm_on': 'PENDING', 'activation_code': activation_code})
+        order = consume_order_code('ORDER_CONFIRM', activation_code)
+        self.get_serializer(order, context={'confirm_on': 'PENDING'})
         return Response({'message': f'Order on {order.product.title} confirmed'})
 
 
@@ -97,7 +130,6 @@ class OrderComplete(generics.RetrieveAPIView):
     serializer_class = OrderConfirmSerializer
 
     def get(self, request, activation_code):
-        order = Order.objects.get(activation_code=activation_code)
-        self.get_serializer(
-            order, context={'confirm_on': 'DELIVER', 'activation_code': activation_code})
+        order = consume_order_code('ORDER_COMPLETE', activation_code)
+        self.get_serializer(order, context={'confirm_on': 'DELIVER'})
         return Response({'message': f'Order {order.product.title} completed'})
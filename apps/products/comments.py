@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Comment
+
+# Reads at most `size` index entries per product
+FIRST_COMMENTS_LATERAL = """
+SELECT head.id FROM unnest(%s::bigint[]) AS product (id)
+CROSS JOIN LATERAL (
+    SELECT id FROM {table} WHERE product_id = product.id
+    ORDER BY created_at, id LIMIT %s
+) AS head
+"""
+
+FIRST_COMMENTS_WINDOW = """
+SELECT id FROM (
+    SELECT id, ROW_NUMBER() OVER (
+        PARTITION BY product_id ORDER BY created_at, id) AS position
+    FROM {table} WHERE product_id IN ({placeholders})
+) AS ranked WHERE position <= %s
+"""
+
+
+def first_comment_ids(product_ids, size):
+    table = Comment._meta.db_table
+    if connection.vendor == 'postgresql':
+        return RawSQL(FIRST_COMMENTS_LATERAL.format(table=table),
+                      [list(product_ids), size])
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    return RawSQL(
+        FIRST_COMMENTS_WINDOW.format(table=table, placeholders=placeholders),
+        [*product_ids, size])
+
+
+def attach_first_comments(products):
+    """
+    Sets `first_comments` of every product to its first
+    PRODUCT_DETAIL_COMMENTS comments, loaded with a single query
+    """
+    products = [product for product in products if product is not None]
+    if not products:
+        return
+    size = settings.PRODUCT_DETAIL_COMMENTS
+    by_product = {product.pk: [] for product in products}
+    comments = (Comment.objects
+                .filter(id__in=first_comment_ids(list(by_product), size))
+                .select_related('user'))
+    for comment in comments:
+        by_product[comment.product_id].append(comment)
+    for product in products:
+        product.first_comments = by_product[product.pk]
@@ -0,0 +1,62 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+
+def prefix_tsquery(terms):
+    """ Builds a raw tsquery from user input, keeping only word characters """
+    words = [word for term in terms for word in re.findall(r'\w+', term)]
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Full text search over the indexed `search_vector` on PostgreSQL,
+    every term is matched as a prefix and results are ranked. Other
+    databases fall back to the `icontains` lookups of SearchFilter.
+    """
+
+    def get_search_query(self, request, config):
+        raw_query = prefix_tsquery(self.get_search_terms(request))
+        if not raw_query:
+            return None
+        return SearchQuery(raw_query, search_type='raw', config=config)
+
+    def filter_queryset(self, request, queryset, view):
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        query = self.get_search_query(request, queryset.model.SEARCH_CONFIG)
+        if query is None:
+            return queryset
+        return (queryset
+                .annotate(search_rank=SearchRank(F('search_vector'), query))
+                .filter(search_vector=query)
+                .order_by('-search_rank', *(queryset.query.order_by or
+                                            queryset.model._meta.ordering)))
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    `ratings` sorts by the stored rating counters instead of joining the
+    ratings, unrated products count as 0. Ties are broken by id, so page
+    numbers don't repeat or skip products.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+
+        if 'ratings' in {field.lstrip('-') for field in ordering}:
+            queryset = queryset.annotate(rating_value=Coalesce(
+                Cast('rating_sum', FloatField()) / NullIf('rating_count', 0),
+                Value(0.0)))
+            # Only the valid `ordering_fields` are left at this point
+            ordering = [field.replace('ratings', 'rating_value')
+                        for field in ordering]
+        return queryset.order_by(*ordering, '-id')
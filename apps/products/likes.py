@@ -0,0 +1,73 @@
+from django.db import IntegrityError, connection, transaction
+
+from core.cache import bump_versions, version_key
+from .models import Like, Product
+from .signals import update_counters
+
+TOGGLE_LIKE = """
+WITH deleted AS (
+    DELETE FROM {table} WHERE user_id = %s AND product_id = %s RETURNING 1
+), inserted AS (
+    INSERT INTO {table} (user_id, product_id, created_at)
+    SELECT %s, %s, now() WHERE NOT EXISTS (SELECT 1 FROM deleted)
+    ON CONFLICT (user_id, product_id) DO NOTHING
+    RETURNING 1
+)
+SELECT EXISTS (SELECT 1 FROM deleted), EXISTS (SELECT 1 FROM inserted)
+"""
+
+
+def toggle_like(user_id, product_id):
+    """ Likes the product or takes the like back, returns the new state """
+    if connection.vendor != 'postgresql':
+        return _toggle_like_with_orm(user_id, product_id)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(TOGGLE_LIKE.format(table=Like._meta.db_table),
+                           [user_id, product_id] * 2)
+            deleted, inserted = cursor.fetchone()
+        if deleted or inserted:
+            update_counters(product_id, likes_count=1 if inserted else -1)
+    # A concurrent tap that lost the insert race leaves the like in place
+    return not deleted
+
+
+def _toggle_like_with_orm(user_id, product_id):
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(
+            user_id=user_id, product_id=product_id).delete()
+        if deleted:
+            return False
+        try:
+            with transaction.atomic():
+                Like.objects.create(user_id=user_id, product_id=product_id)
+        except IntegrityError:
+            pass
+    return True
+
+
+def sync_likes(user_id, taps):
+    """
+    Applies offline taps as (product id, liked) pairs, the last tap of a
+    product wins. Returns ids of the synced products that are liked now.
+    """
+    states = dict(taps)
+    product_ids = set(Product.objects
+                      .filter(pk__in=states)
+                      .values_list('id', flat=True))
+    liked = {pk for pk in product_ids if states[pk]}
+
+    with transaction.atomic():
+        Like.objects.bulk_create(
+            [Like(user_id=user_id, product_id=pk) for pk in liked],
+            ignore_conflicts=True)
+        # Counters are rebuilt below, the per-like delete signals would
+        # update and bump every product one by one
+        unliked = Like.objects.filter(
+            user_id=user_id, product_id__in=product_ids - liked)
+        unliked._raw_delete(unliked.db)
+        Product.objects.filter(pk__in=product_ids).rebuild_counters()
+        bump_versions([version_key('products')] +
+                      [version_key('product', pk) for pk in product_ids])
+    return sorted(liked)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recalculates stored rating, like and order counters of products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'ids', nargs='*', type=int,
+            help='Product ids to rebuild, all products by default')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['ids']:
+            products = products.filter(pk__in=options['ids'])
+        updated = products.rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt counters for {updated} products'))
@@ -0,0 +1,65 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:38
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Count, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Rating = apps.get_model('products', 'Rating')
+    Like = apps.get_model('products', 'Like')
+    Order = apps.get_model('orders', 'Order')
+    db_alias = schema_editor.connection.alias
+
+    def aggregate(model, expression):
+        return Coalesce(Subquery(
+            model.objects.filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(value=expression)
+            .values('value')), Value(0))
+
+    Product.objects.using(db_alias).update(
+        rating_sum=aggregate(Rating, Sum('rate')),
+        rating_count=aggregate(Rating, Count('id')),
+        likes_count=aggregate(Like, Count('id')),
+        orders_count=aggregate(Order, Count('id')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='orders_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='renditions',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+    ]
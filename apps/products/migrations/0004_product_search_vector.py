@@ -0,0 +1,59 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:12
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('simple', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}description, '')), 'B')
+"""
+
+CREATE_SEARCH_INDEX = f"""
+CREATE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_product_search_vector_trigger
+BEFORE INSERT OR UPDATE OF title, description ON products_product
+FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update();
+
+UPDATE products_product SET search_vector = {SEARCH_VECTOR.format(row='')};
+
+CREATE INDEX products_product_search_vector_idx
+ON products_product USING gin (search_vector);
+"""
+
+DROP_SEARCH_INDEX = """
+DROP INDEX IF EXISTS products_product_search_vector_idx;
+DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product;
+DROP FUNCTION IF EXISTS products_product_search_vector_update();
+"""
+
+
+def run_on_postgresql(sql):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_on_postgresql(CREATE_SEARCH_INDEX),
+            run_on_postgresql(DROP_SEARCH_INDEX)),
+    ]
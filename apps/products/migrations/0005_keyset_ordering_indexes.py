@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['created_at', 'id'], 'verbose_name': 'Коментарий', 'verbose_name_plural': 'Коментарии'},
+        ),
+        migrations.AlterModelOptions(
+            name='product',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name': 'Продукт', 'verbose_name_plural': 'Продукты'},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='products_co_product_199940_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='products_pr_created_e6f9fc_idx'),
+        ),
+    ]
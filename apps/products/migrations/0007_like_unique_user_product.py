@@ -0,0 +1,53 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """ Keeps the first like of every user and product pair """
+    Product = apps.get_model('products', 'Product')
+    Like = apps.get_model('products', 'Like')
+    db_alias = schema_editor.connection.alias
+
+    duplicates = (Like.objects
+                  .using(db_alias)
+                  .values('user', 'product')
+                  .annotate(first_id=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    product_ids = set()
+    for duplicate in duplicates.iterator():
+        (Like.objects
+         .using(db_alias)
+         .filter(user=duplicate['user'], product=duplicate['product'])
+         .exclude(id=duplicate['first_id'])
+         .delete())
+        product_ids.add(duplicate['product'])
+
+    (Product.objects
+     .using(db_alias)
+     .filter(pk__in=product_ids)
+     .update(likes_count=Coalesce(
+         Subquery(Like.objects
+                  .filter(product=OuterRef('pk'))
+                  .order_by()
+                  .values('product')
+                  .annotate(value=Count('id'))
+                  .values('value')), Value(0))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_like_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_user_product_like'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:21
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_ratings(apps, schema_editor):
+    """ Keeps the latest rating of every user and product pair """
+    Product = apps.get_model('products', 'Product')
+    Rating = apps.get_model('products', 'Rating')
+    db_alias = schema_editor.connection.alias
+
+    duplicates = (Rating.objects
+                  .using(db_alias)
+                  .values('user', 'product')
+                  .annotate(last_id=Max('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    product_ids = set()
+    for duplicate in duplicates.iterator():
+        (Rating.objects
+         .using(db_alias)
+         .filter(user=duplicate['user'], product=duplicate['product'])
+         .exclude(id=duplicate['last_id'])
+         .delete())
+        product_ids.add(duplicate['product'])
+
+    def aggregate(expression):
+        return Coalesce(Subquery(
+            Rating.objects.filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(value=expression)
+            .values('value')), Value(0))
+
+    Product.objects.using(db_alias).filter(pk__in=product_ids).update(
+        rating_sum=aggregate(Sum('rate')),
+        rating_count=aggregate(Count('id')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_like_unique_user_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ratings,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_user_product_rating'),
+        ),
+    ]
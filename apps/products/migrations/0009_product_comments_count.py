@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_comments_count(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Comment = apps.get_model('products', 'Comment')
+    db_alias = schema_editor.connection.alias
+
+    Product.objects.using(db_alias).update(comments_count=Coalesce(
+        Subquery(Comment.objects
+                 .filter(product=OuterRef('pk'))
+                 .order_by()
+                 .values('product')
+                 .annotate(value=Count('id'))
+                 .values('value')), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_rating_unique_user_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_comments_count, migrations.RunPython.noop),
+    ]
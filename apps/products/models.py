@@ -1,7 +1,15 @@
+from django.apps import apps
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.storage import default_storage
 from django.db import models
+from django.db.models import OuterRef, Subquery, Count, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 
+from core.sparse import SparseFieldset
+
 
 User = get_user_model()
 
@@ -17,26 +25,89 @@ class Category(models.Model):
         return self.title
 
 
+def _subquery_aggregate(queryset, aggregate):
+    return Coalesce(Subquery(
+        queryset.filter(product=OuterRef('pk'))
+        .order_by()
+        .values('product')
+        .annotate(value=aggregate)
+        .values('value')), Value(0))
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_relations(self, sparse=None):
+        """ Only relations the fieldset renders are loaded, the first
+        comments are loaded by the serializer for the whole page """
+        sparse = sparse or SparseFieldset()
+        queryset = self
+        if sparse.expands('user'):
+            queryset = queryset.select_related('user')
+        if sparse.wants('categories'):
+            queryset = queryset.prefetch_related('categories')
+        return queryset
+
+    def rebuild_counters(self):
+        """ Recalculates stored counters with a single UPDATE """
+        return self.update(
+            rating_sum=_subquery_aggregate(Rating.objects, Sum('rate')),
+            rating_count=_subquery_aggregate(Rating.objects, Count('id')),
+            likes_count=_subquery_aggregate(Like.objects, Count('id')),
+            comments_count=_subquery_aggregate(Comment.objects, Count('id')),
+            orders_count=_subquery_aggregate(
+                apps.get_model('orders', 'Order').objects, Count('id')),
+        )
+
+
 class Product(models.Model):
+    DEFAULT_IMAGE = 'default.jpg'
+    SEARCH_CONFIG = 'simple'
+
     user = models.ForeignKey(
         User, related_name='products', on_delete=models.CASCADE)
     categories = models.ManyToManyField(Category)
     title = models.CharField(max_length=50)
-    image = models.ImageField(default='default.jpg')
+    image = models.ImageField(default=DEFAULT_IMAGE)
+    renditions = models.JSONField(default=dict, editable=False)
     price = models.PositiveIntegerField()
     description = models.TextField()
     is_sold = models.BooleanField(default=False)
     created_at = models.DateField(auto_now_add=True)
     updated_at = models.DateField(auto_now=True)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    orders_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    # Filled by a database trigger on PostgreSQL, see migration 0004
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = "Продукты"
-        ordering = ['-created_at', 'ratings']
+        ordering = ['-created_at', '-id']
+        indexes = [models.Index(fields=['-created_at', '-id'])]
 
     def __str__(self) -> str:
         return self.title
 
+    @property
+    def images(self):
+        """ Rendition urls, the default image until they are generated """
+        default_url = default_storage.url(self.DEFAULT_IMAGE)
+        images = {name: default_url
+                  for name in settings.PRODUCT_IMAGE_RENDITIONS}
+        images.update({name: default_storage.url(path)
+                       for name, path in self.renditions.items()})
+        return images
+
+    @property
+    def rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
 
 class Comment(models.Model):
     user = models.ForeignKey(
@@ -49,6 +120,8 @@ class Comment(models.Model):
     class Meta:
         verbose_name = 'Коментарий'
         verbose_name_plural = 'Коментарии'
+        ordering = ['created_at', 'id']
+        indexes = [models.Index(fields=['product', 'created_at', 'id'])]
 
     def __str__(self) -> str:
         return f'Коментарий от {self.user.username}'
@@ -59,10 +132,13 @@ class Like(models.Model):
         User, on_delete=models.CASCADE, related_name='likes')
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name='likes')
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = 'Лайк'
         verbose_name_plural = 'Лайки'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'product'], name='unique_user_product_like')]
 
     def __str__(self) -> str:
         return f'Liked by {self.username}'
@@ -82,3 +158,5 @@ class Rating(models.Model):
     class Meta:
         verbose_name = 'Рейтинг'
         verbose_name_plural = 'Рейтинги'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'product'], name='unique_user_product_rating')]
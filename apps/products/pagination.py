@@ -0,0 +1,7 @@
+from core.pagination import KeysetPagination
+
+
+class CommentPagination(KeysetPagination):
+    """ Oldest comments first, backed by the (product, created_at, id) index """
+    ordering = ('created_at', 'id')
+    page_number_params = ('page',)
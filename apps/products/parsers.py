@@ -1,15 +1,97 @@
+from PIL import Image, UnidentifiedImageError
+from django.conf import settings
+from django.core.files.uploadhandler import (FileUploadHandler,
+                                             MemoryFileUploadHandler,
+                                             TemporaryFileUploadHandler)
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser
+from django.http.multipartparser import MultiPartParserError
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
 from rest_framework.parsers import DataAndFiles
 from rest_framework.parsers import MultiPartParser
 
 
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'upload_too_large'
+
+
+class UploadLimitHandler(FileUploadHandler):
+    """ Rejects uploads over the size limit while they are streamed """
+
+    def handle_raw_input(self, input_data, META, content_length,
+                         boundary, encoding=None):
+        if content_length > settings.PRODUCT_UPLOAD_MAX_SIZE:
+            raise UploadTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.PRODUCT_UPLOAD_MAX_SIZE:
+            raise UploadTooLarge()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class ThresholdMemoryUploadHandler(MemoryFileUploadHandler):
+    """ Keeps small uploads in memory, the rest goes to temporary files """
+
+    def handle_raw_input(self, input_data, META, content_length,
+                         boundary, encoding=None):
+        self.activated = (content_length <=
+                          settings.PRODUCT_UPLOAD_MEMORY_THRESHOLD)
+
+
+def check_image_pixels(file):
+    """ Reads only the image header, so nothing is decoded yet """
+    try:
+        with Image.open(file) as image:
+            pixels = image.width * image.height
+    except Image.DecompressionBombError:
+        raise UploadTooLarge('Image has too many pixels.')
+    except (UnidentifiedImageError, OSError):
+        pixels = 0
+    finally:
+        file.seek(0)
+
+    if pixels > settings.PRODUCT_UPLOAD_MAX_PIXELS:
+        raise UploadTooLarge('Image has too many pixels.')
+
+
 class ProductParser(MultiPartParser):
+    def get_upload_handlers(self, request):
+        return [
+            UploadLimitHandler(request),
+            ThresholdMemoryUploadHandler(request),
+            TemporaryFileUploadHandler(request),
+        ]
+
     def parse(self, stream, media_type=None, parser_context=None):
-        raw_parse = super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+
+        try:
+            parser = DjangoMultiPartParser(
+                meta, stream, self.get_upload_handlers(request), encoding)
+            data, files = parser.parse()
+        except MultiPartParserError as exc:
+            raise ParseError('Multipart form parse error - %s' % str(exc))
 
-        data = raw_parse.data.copy()
-        files = raw_parse.files.copy()
+        for file in files.values():
+            check_image_pixels(file)
 
         categories = data.get('categories')
         if categories:
+            # Only the form fields are copied, uploaded files are reused
+            data = data.copy()
             data.setlist('categories', categories.split(','))
         return DataAndFiles(data, files)
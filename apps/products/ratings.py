@@ -0,0 +1,26 @@
+from django.db import transaction
+
+from .models import Product, Rating
+from .signals import update_counters
+
+
+def rate_product(user_id, product_id, rate):
+    """
+    Creates or changes the user's rating and moves the product totals by
+    the difference. Raters of a product are serialized by the lock on its
+    row, which the counter update would take anyway.
+    """
+    with transaction.atomic():
+        Product.objects.select_for_update().filter(pk=product_id).exists()
+        rating = (Rating.objects
+                  .filter(user_id=user_id, product_id=product_id)
+                  .first())
+        if rating is None:
+            rating, = Rating.objects.bulk_create([Rating(
+                user_id=user_id, product_id=product_id, rate=rate)])
+            update_counters(product_id, rating_sum=rate, rating_count=1)
+        elif rating.rate != rate:
+            Rating.objects.filter(pk=rating.pk).update(rate=rate)
+            update_counters(product_id, rating_sum=rate - rating.rate)
+            rating.rate = rate
+    return rating
@@ -0,0 +1,121 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import combinations
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.cache import bump_versions, version_key
+from .models import Product, Like
+
+GLOBAL_KEY = 'recommendations:global'
+CATEGORY_KEY = 'recommendations:category:{}'
+SIMILAR_KEY = 'recommendations:similar:{}'
+
+
+def get_option(name):
+    return settings.RECOMMENDATIONS[name]
+
+
+def interactions(since):
+    """ (user_id, product_id, created_at, weight) of recent orders and likes """
+    Order = apps.get_model('orders', 'Order')
+    for model, weight in ((Order, get_option('ORDER_WEIGHT')),
+                          (Like, get_option('LIKE_WEIGHT'))):
+        rows = (model.objects
+                .filter(created_at__gte=since)
+                .values_list('user', 'product', 'created_at')
+                .iterator())
+        for user_id, product_id, created_at in rows:
+            yield user_id, product_id, created_at, weight
+
+
+def top(scores, size):
+    return [product_id for product_id, _ in
+            sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:size]]
+
+
+def build_recommendations():
+    """
+    Ranks products by time-decayed popularity, globally and per category,
+    and finds item-to-item neighbours among products that were ordered or
+    liked by the same users. Results are stored in the cache.
+    """
+    now = timezone.now()
+    half_life = timedelta(days=get_option('HALF_LIFE_DAYS'))
+    size = get_option('SIZE')
+    available = set(Product.objects
+                    .filter(is_sold=False)
+                    .values_list('id', flat=True))
+
+    popularity = defaultdict(float)
+    user_products = defaultdict(set)
+    since = now - timedelta(days=get_option('WINDOW_DAYS'))
+    for user_id, product_id, created_at, weight in interactions(since):
+        popularity[product_id] += weight * 0.5 ** ((now - created_at) / half_life)
+        user_products[user_id].add(product_id)
+    popularity = {product_id: score for product_id, score in popularity.items()
+                  if product_id in available}
+
+    by_category = defaultdict(dict)
+    memberships = (Product.categories.through.objects
+                   .filter(product__in=popularity)
+                   .values_list('category', 'product'))
+    for category_id, product_id in memberships:
+        by_category[category_id][product_id] = popularity[product_id]
+
+    co_occurrence = defaultdict(lambda: defaultdict(int))
+    for products in user_products.values():
+        for first, second in combinations(sorted(products & available), 2):
+            co_occurrence[first][second] += 1
+            co_occurrence[second][first] += 1
+
+    entries = {GLOBAL_KEY: top(popularity, size)}
+    entries.update({CATEGORY_KEY.format(category_id): top(scores, size)
+                    for category_id, scores in by_category.items()})
+    entries.update({SIMILAR_KEY.format(product_id): top(
+                        neighbours, get_option('NEIGHBOURS'))
+                    for product_id, neighbours in co_occurrence.items()})
+    cache.set_many(entries, get_option('TTL'))
+    bump_versions([version_key('recommendations')])
+    return entries
+
+
+def personal_recommendations(user, size):
+    """ Neighbours of everything the user ordered or liked, then global """
+    Order = apps.get_model('orders', 'Order')
+    seen = set(Like.objects
+               .filter(user=user)
+               .values_list('product', flat=True))
+    seen.update(Order.objects
+                .filter(user=user)
+                .values_list('product', flat=True))
+
+    scores = defaultdict(float)
+    similar = cache.get_many([SIMILAR_KEY.format(product_id)
+                              for product_id in seen])
+    for neighbours in similar.values():
+        for rank, product_id in enumerate(neighbours):
+            scores[product_id] += 1 / (rank + 1)
+
+    ranked = top(scores, size) + cache.get(GLOBAL_KEY, [])
+    recommendations = []
+    for product_id in ranked:
+        if product_id not in seen and product_id not in recommendations:
+            recommendations.append(product_id)
+    return recommendations[:size]
+
+
+def get_recommendations(user=None, category=None, size=None):
+    """ Ready-made product ids, None when nothing has been built yet """
+    size = size or get_option('SIZE')
+    if category is not None:
+        ids = cache.get(CATEGORY_KEY.format(category))
+        return ids[:size] if ids is not None else None
+    if cache.get(GLOBAL_KEY) is None:
+        return None
+    if user is not None and user.is_authenticated:
+        return personal_recommendations(user, size)
+    return cache.get(GLOBAL_KEY)[:size]
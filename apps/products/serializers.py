@@ -1,11 +1,14 @@
-from PIL import Image
-from django.db.models import Avg
-from django.core.files.storage import default_storage
+from django.conf import settings
 from rest_framework import serializers
 
+from core.metrics import TimedListSerializer, TimedSerializerMixin
+from core.sparse import SparseFieldsMixin
 from .models import Product
+from .tasks import generate_product_renditions
+from .ratings import rate_product
+from .comments import attach_first_comments
 from apps.users.serializers import UserSerializer
-from .models import Comment, Rating, Like, Category
+from .models import Comment, Rating, Category
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -14,78 +17,103 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ('id', 'title')
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                            serializers.ModelSerializer):
+    ratings = serializers.FloatField(source='rating', read_only=True)
+    images = serializers.DictField(read_only=True)
+
     class Meta:
         model = Product
         fields = (
-            'id', 'categories', 'user', 'title', 'ratings',
-            'ratings', 'image', 'price', 'is_sold')
+            'id', 'categories', 'user', 'title',
+            'ratings', 'image', 'images', 'price', 'is_sold')
+        list_serializer_class = TimedListSerializer
 
     def to_representation(self, instance):
         repr = super().to_representation(instance)
-        repr['user'] = UserSerializer(instance.user).data
-        repr['categories'] = [
-            category.title for category in instance.categories.all()]
-        repr['ratings'] = (instance
-                           .ratings
-                           .aggregate(Avg('rate'))['rate__avg'])
+        if self.sparse.expands('user'):
+            repr['user'] = UserSerializer(instance.user).data
+        if self.sparse.expands('categories'):
+            repr['categories'] = [
+                category.title for category in instance.categories.all()]
         return repr
 
 
-class ProductSerializer(serializers.ModelSerializer):
-    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    orders_count = serializers.SerializerMethodField(method_name='get_orders_count')
-    likes = serializers.SerializerMethodField(method_name='get_likes_count')
+class ProductDetailListSerializer(TimedListSerializer):
+    """ Loads the first comments of all products in one query """
 
+    def to_representation(self, data):
+        products = list(data.all() if hasattr(data, 'all') else data)
+        if self.child.sparse.expands('comments'):
+            attach_first_comments(products)
+        return super().to_representation(products)
+
+
+class ProductSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                        serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    likes = serializers.IntegerField(source='likes_count', read_only=True)
+    ratings = serializers.FloatField(source='rating', read_only=True)
+    images = serializers.DictField(read_only=True)
 
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('rating_sum', 'rating_count', 'likes_count',
+                   'renditions', 'search_vector')
         read_only_fields = (
             'id', 'user', 'comments', 'orders_count')
-
-    def get_orders_count(self, product):
-        return product.orders.count()
-    
-    def get_likes_count(self, product):
-        return product.likes.count()
+        list_serializer_class = ProductDetailListSerializer
 
     def create(self, validated_data):
-        image_path = validated_data.get('image')
-        if image_path:
-            image = Image.open(image_path)
-
-            if image.height > 300 or image.width > 300:
-                image.thumbnail((300, 300))
-
-                with default_storage.open(image_path.name, 'wb') as f:
-                    image.save(f, format=image.format)
-
-        return super().create(validated_data)
+        product = super().create(validated_data)
+        if 'image' in validated_data:
+            generate_product_renditions.delay_on_commit(product.id)
+        return product
+
+    def update(self, instance, validated_data):
+        replaced = []
+        if 'image' in validated_data:
+            replaced = list(instance.renditions.values())
+            instance.renditions = {}
+        product = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            generate_product_renditions.delay_on_commit(product.id, replaced)
+        return product
 
     def to_representation(self, instance):
         repr = super().to_representation(instance)
-        repr['user'] = UserSerializer(instance.user).data
-        repr['categories'] = [
-            category.title for category in instance.categories.all()]
-        repr['comments'] = CommentSerializer(
-            instance.comments.all(), many=True).data
-        repr['ratings'] = (instance
-                           .ratings
-                           .aggregate(Avg('rate'))['rate__avg'])
+        if self.sparse.expands('user'):
+            repr['user'] = UserSerializer(instance.user).data
+        elif self.sparse.wants('user'):
+            repr['user'] = instance.user_id
+        if self.sparse.expands('categories'):
+            repr['categories'] = [
+                category.title for category in instance.categories.all()]
+        if self.sparse.expands('comments'):
+            comments = getattr(instance, 'first_comments', None)
+            if comments is None:
+                comments = (instance.comments
+                            .select_related('user')
+                            [:settings.PRODUCT_DETAIL_COMMENTS])
+            repr['comments'] = CommentSerializer(comments, many=True).data
         return repr
 
 
-class LikeSerializer:
-    def __init__(self, user, product, **kwargs):
-        like = Like.objects.filter(user=user, product=product)
-        
-        if like.exists():
-            like.delete()
-            self.data = {'liked': False}
-        else:
-            Like.objects.create(user=user, product=product).save()
-            self.data = {'liked': True}
+class LikeTapSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    liked = serializers.BooleanField()
+
+
+class LikeSyncSerializer(serializers.Serializer):
+    max_taps = 500
+
+    likes = LikeTapSerializer(many=True, allow_empty=False)
+
+    def validate_likes(self, likes):
+        if len(likes) > self.max_taps:
+            raise serializers.ValidationError(
+                f'No more than {self.max_taps} likes at once')
+        return likes
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -97,6 +125,11 @@ class CommentSerializer(serializers.ModelSerializer):
                   'text', 'created_at')
         read_only_fields = ('product',)
 
+    def to_representation(self, instance):
+        repr = super().to_representation(instance)
+        repr['user'] = UserSerializer(instance.user).data
+        return repr
+
 
 class RatingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -104,15 +137,7 @@ class RatingSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'product', 'rate')
         read_only_fields = ('user', 'product')
 
-    def validate(self, attrs):
-        user = self.context.get('request').user
-        product = self.context.get('product')
-        rate = Rating.objects.filter(user=user, product=product)
-        if rate:
-            raise serializers.ValidationError(
-                {'message': 'Rate already exists'})
-        return attrs
-
     def create(self, validated_data):
-        validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+        return rate_product(self.context['request'].user.id,
+                            validated_data['product'].id,
+                            validated_data['rate'])
@@ -0,0 +1,90 @@
+from django.db.models import F
+from django.db.models.signals import (pre_save, post_save, post_delete,
+                                      m2m_changed)
+from django.dispatch import receiver
+
+from core.cache import bump_versions, version_key
+from .models import Product, Category, Comment, Rating, Like
+
+
+def bump_product_versions(product_id):
+    bump_versions([version_key('product', product_id),
+                   version_key('products')])
+
+
+def update_counters(product_id, **deltas):
+    """ Applies counter deltas in one UPDATE, safe for concurrent writers """
+    Product.objects.filter(pk=product_id).update(**{
+        field: F(field) + delta for field, delta in deltas.items()})
+    bump_product_versions(product_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    bump_product_versions(instance.pk)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Product):
+        bump_product_versions(instance.pk)
+    elif action.startswith('post_'):
+        bump_versions([version_key('products')])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    bump_versions([version_key('products'), version_key('categories')])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        update_counters(instance.product_id, comments_count=1)
+    else:
+        bump_product_versions(instance.product_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    update_counters(instance.product_id, comments_count=-1)
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_rate(sender, instance, **kwargs):
+    instance._previous_rate = None
+    if instance.pk:
+        instance._previous_rate = (Rating.objects
+                                   .filter(pk=instance.pk)
+                                   .values_list('rate', flat=True)
+                                   .first())
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, **kwargs):
+    previous_rate = getattr(instance, '_previous_rate', None)
+    if created or previous_rate is None:
+        update_counters(instance.product_id, rating_sum=instance.rate,
+                        rating_count=1)
+    elif previous_rate != instance.rate:
+        update_counters(instance.product_id,
+                        rating_sum=instance.rate - previous_rate)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    update_counters(instance.product_id, rating_sum=-instance.rate,
+                    rating_count=-1)
+
+
+@receiver(post_save, sender=Like)
+def like_saved(sender, instance, created, **kwargs):
+    if created:
+        update_counters(instance.product_id, likes_count=1)
+
+
+@receiver(post_delete, sender=Like)
+def like_deleted(sender, instance, **kwargs):
+    update_counters(instance.product_id, likes_count=-1)
@@ -0,0 +1,83 @@
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps, features
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from celery import shared_task
+
+from core.celery import LogErrorsTask
+from .models import Product
+from .signals import bump_product_versions
+from . import recommendations
+
+
+def rendition_formats():
+    formats = ['JPEG', 'WEBP']
+    if features.check('avif'):
+        formats.append('AVIF')
+    return formats
+
+
+def render(image, size, image_format):
+    rendition = image.copy()
+    rendition.thumbnail(size)
+    if image_format == 'JPEG' and rendition.mode != 'RGB':
+        rendition = rendition.convert('RGB')
+    content = BytesIO()
+    rendition.save(content, format=image_format, quality=85)
+    return ContentFile(content.getvalue())
+
+
+def delete_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+@shared_task(base=LogErrorsTask)
+def generate_product_renditions(product_id, replaced=()):
+    """ `replaced` are renditions of the previous image, they are deleted
+    here so the files are not removed while this task writes new ones """
+    product = Product.objects.get(pk=product_id)
+    if not product.image or product.image.name == Product.DEFAULT_IMAGE:
+        delete_files(replaced)
+        return
+
+    with product.image.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+
+    stem = os.path.splitext(os.path.basename(product.image.name))[0]
+    renditions = {}
+    for name, size in settings.PRODUCT_IMAGE_RENDITIONS.items():
+        for image_format in rendition_formats():
+            extension = image_format.lower().replace('jpeg', 'jpg')
+            path = f'renditions/{product.pk}/{stem}_{name}.{extension}'
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            key = name if image_format == 'JPEG' else f'{name}_{extension}'
+            renditions[key] = default_storage.save(
+                path, render(image, size, image_format))
+
+    updated = (Product.objects
+               .filter(pk=product.pk, image=product.image.name)
+               .update(renditions=renditions))
+    stale = set(replaced) | set(product.renditions.values())
+    if updated:
+        bump_product_versions(product.pk)
+        stale -= set(renditions.values())
+    else:
+        # The image was replaced meanwhile, keep only what is stored now
+        stale |= set(renditions.values())
+        current = (Product.objects
+                   .filter(pk=product.pk)
+                   .values_list('renditions', flat=True)
+                   .first())
+        stale -= set((current or {}).values())
+    delete_files(stale)
+
+
+@shared_task(base=LogErrorsTask)
+def build_recommendations():
+    recommendations.build_recommendations()
@@ -1,9 +1,29 @@
+import json
+import shutil
+import tempfile
+from base64 import urlsafe_b64encode
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 
-from .models import Product, Category
+from .models import Product, Category, Comment, Like, Rating
 from .serializers import ProductSerializer
+from .tasks import generate_product_renditions, build_recommendations
+from .filters import prefix_tsquery
+from .likes import sync_likes
+from apps.orders.models import Order
 
 User = get_user_model()
 
@@ -35,6 +55,7 @@ class ProductViewSetTestCase(APITestCase):
             description='This is a test product')
         response = self.client.get(f'/products/{product.pk}/')
         response.data['image'] = f'/media/{product.image.name}'
+        self.assertFalse(response.data.pop('is_liked'))
         serializer = ProductSerializer(product)
         self.assertEqual(response.data, serializer.data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -63,3 +84,495 @@ class ProductViewSetTestCase(APITestCase):
         response = self.client.delete(f'/products/{product.pk}/')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Product.objects.count(), 0)
+
+
+class ProductCountersTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username='owner', password='testpass', email='owner@test.com')
+        self.user = User.objects.create_user(
+            username='buyer', password='testpass', email='buyer@test.com')
+        self.product = Product.objects.create(
+            user=self.owner, title='Test Product', price=100,
+            description='This is a test product')
+
+    def test_counters_follow_writes(self):
+        rating = Rating.objects.create(
+            user=self.user, product=self.product, rate=4)
+        Rating.objects.create(user=self.owner, product=self.product, rate=1)
+        like = Like.objects.create(user=self.user, product=self.product)
+        Order.objects.create(
+            user=self.user, product=self.product, address='Test address')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating, 2.5)
+        self.assertEqual(self.product.likes_count, 1)
+        self.assertEqual(self.product.orders_count, 1)
+
+        rating.rate = 5
+        rating.save()
+        like.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, 6)
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.likes_count, 0)
+
+    def test_rating_is_upserted(self):
+        self.client.force_authenticate(user=self.user)
+        url = f'/products/{self.product.id}/rate/'
+        first = self.client.post(url, {'rate': 4}).data
+        second = self.client.post(url, {'rate': 2}).data
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual(second['rate'], 2)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, 2)
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(Rating.objects.get().rate, 2)
+
+    def test_rebuild_counters_command(self):
+        Rating.objects.create(user=self.user, product=self.product, rate=3)
+        Like.objects.create(user=self.user, product=self.product)
+        Product.objects.update(
+            rating_sum=0, rating_count=0, likes_count=0, orders_count=7)
+        call_command('rebuild_product_counters', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating, 3)
+        self.assertEqual(self.product.likes_count, 1)
+        self.assertEqual(self.product.orders_count, 0)
+
+
+class ProductQueryCountTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpass', email='test@test.com')
+        self.category = Category.objects.create(title='Test category')
+
+    def create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                user=self.user, title=f'Product {i}', price=100,
+                description='This is a test product')
+            product.categories.add(self.category)
+            Comment.objects.create(
+                user=self.user, product=product, text='Test comment')
+            Rating.objects.create(user=self.user, product=product, rate=5)
+        return product
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        self.create_products(2)
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/')
+        self.assertEqual(response.data['results'][0]['ratings'], 5)
+
+        cache.clear()
+        self.create_products(8)
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/')
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_detail_queries(self):
+        product = self.create_products(1)
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/products/{product.pk}/')
+        self.assertEqual(len(response.data['comments']), 1)
+        self.assertEqual(response.data['categories'], ['Test category'])
+
+    def test_sparse_fieldsets_skip_relations(self):
+        product = self.create_products(2)
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/?fields=title,price')
+        self.assertEqual(response.data['results'][0],
+                         {'id': product.pk, 'title': 'Product 1',
+                          'price': 100, 'is_liked': False})
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                f'/products/{product.pk}/?fields=user,categories,comments'
+                f'&expand=categories')
+        self.assertEqual(response.data['user'], self.user.pk)
+        self.assertEqual(response.data['categories'], ['Test category'])
+        self.assertNotIn('comments', response.data)
+        self.assertNotIn('title', response.data)
+
+    @override_settings(PRODUCT_DETAIL_COMMENTS=2)
+    def test_detail_embeds_first_comments(self):
+        product = self.create_products(1)
+        for i in range(3):
+            Comment.objects.create(
+                user=self.user, product=product, text=f'Comment {i}')
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/products/{product.pk}/')
+        self.assertEqual(response.data['comments_count'], 4)
+        self.assertEqual([comment['text'] for comment in
+                          response.data['comments']],
+                         ['Test comment', 'Comment 0'])
+        self.assertEqual(response.data['comments'][0]['user']['username'],
+                         'testuser')
+
+    @override_settings(PRODUCT_DETAIL_COMMENTS=2)
+    def test_lists_embed_first_comments_in_one_query(self):
+        self.create_products(3)
+        for product in Product.objects.all():
+            Like.objects.create(user=self.user, product=product)
+            for i in range(3):
+                Comment.objects.create(
+                    user=self.user, product=product, text=f'Comment {i}')
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(3):
+            response = self.client.get('/accounts/favorites/')
+        for product in response.data['results']:
+            self.assertEqual([comment['text'] for comment in
+                              product['comments']],
+                             ['Test comment', 'Comment 0'])
+
+    def test_comments_are_paginated_by_cursor(self):
+        product = self.create_products(1)
+        for i in range(24):
+            Comment.objects.create(
+                user=self.user, product=product, text=f'Comment {i}')
+        url = f'/products/{product.pk}/comments/'
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['text'], 'Test comment')
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([comment['text'] for comment in
+                          response.data['results']],
+                         [f'Comment {i}' for i in range(19, 24)])
+        self.assertIsNone(response.data['next'])
+
+        Comment.objects.get(pk=response.data['results'][0]['id']).delete()
+        product.refresh_from_db()
+        self.assertEqual(product.comments_count, 24)
+
+
+class ProductCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpass', email='test@test.com')
+        self.product = Product.objects.create(
+            user=self.user, title='Test Product', price=100,
+            description='This is a test product')
+        self.client.force_authenticate(user=self.user)
+
+    def test_detail_is_cached_until_product_changes(self):
+        url = f'/products/{self.product.pk}/'
+        self.assertEqual(self.client.get(url).data['likes'], 0)
+        with self.assertNumQueries(1):
+            self.assertFalse(self.client.get(url).data['is_liked'])
+
+        self.client.post(f'{url}like/')
+        response = self.client.get(url)
+        self.assertEqual(response.data['likes'], 1)
+        self.assertTrue(response.data['is_liked'])
+        self.client.post(f'{url}rate/', {'rate': 4})
+        self.assertEqual(self.client.get(url).data['ratings'], 4)
+        self.client.post(f'{url}comment/', {'text': 'Test comment'})
+        self.assertEqual(len(self.client.get(url).data['comments']), 1)
+
+    def test_public_data_is_shared_between_users(self):
+        other = User.objects.create_user(
+            username='other', password='testpass', email='other@test.com')
+        Like.objects.create(user=other, product=self.product)
+        self.client.get('/products/?search=&page=1')
+
+        self.client.force_authenticate(user=other)
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/?page=1')
+        self.assertTrue(response.data['results'][0]['is_liked'])
+
+        self.client.force_authenticate(user=None)
+        with self.assertNumQueries(0):
+            response = self.client.get('/products/?page=1')
+        self.assertFalse(response.data['results'][0]['is_liked'])
+
+    def test_list_is_invalidated_by_writes(self):
+        response = self.client.get('/products/')
+        self.assertEqual(len(response.data['results']), 1)
+        Product.objects.create(
+            user=self.user, title='New Product', price=100,
+            description='This is a test product')
+        response = self.client.get('/products/')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class ProductImageTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpass', email='test@test.com')
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(title='Test category')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def upload(self, size):
+        content = BytesIO()
+        Image.new('RGB', size, 'red').save(content, format='JPEG')
+        return SimpleUploadedFile(
+            'photo.jpg', content.getvalue(), content_type='image/jpeg')
+
+    def test_renditions_are_generated_in_background(self):
+        response = self.client.post('/products/', {
+            'title': 'Test Product', 'price': 100,
+            'description': 'This is a test product',
+            'categories': self.category.id,
+            'image': self.upload((2000, 1000))})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(
+            response.data['images']['card'].endswith('/default.jpg'))
+
+        product = Product.objects.get()
+        with Image.open(product.image) as original:
+            self.assertEqual(original.size, (2000, 1000))
+
+        generate_product_renditions(product.id)
+        product.refresh_from_db()
+        with Image.open(default_storage.open(product.renditions['card'])) as card:
+            self.assertEqual(card.size, (300, 150))
+        self.assertIn('card_webp', product.renditions)
+        images = self.client.get(f'/products/{product.pk}/').data['images']
+        self.assertTrue(images['thumbnail'].endswith('_thumbnail.jpg'))
+
+    def test_replaced_renditions_are_deleted(self):
+        self.post_image((800, 600))
+        product = Product.objects.get()
+        generate_product_renditions(product.id)
+        product.refresh_from_db()
+        old_renditions = list(product.renditions.values())
+
+        with mock.patch.object(generate_product_renditions,
+                               'delay_on_commit') as delay_on_commit:
+            self.client.patch(f'/products/{product.pk}/',
+                              {'image': self.upload((400, 300))})
+        delay_on_commit.assert_called_once_with(product.id, old_renditions)
+        generate_product_renditions(product.id, old_renditions)
+        product.refresh_from_db()
+        for path in old_renditions:
+            self.assertFalse(default_storage.exists(path))
+        for path in product.renditions.values():
+            self.assertTrue(default_storage.exists(path))
+
+    def post_image(self, size):
+        return self.client.post('/products/', {
+            'title': 'Test Product', 'price': 100,
+            'description': 'This is a test product',
+            'categories': self.category.id,
+            'image': self.upload(size)})
+
+    def test_upload_limits(self):
+        with self.settings(PRODUCT_UPLOAD_MAX_PIXELS=100 * 100):
+            response = self.post_image((101, 100))
+        self.assertEqual(response.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        with self.settings(PRODUCT_UPLOAD_MAX_SIZE=512):
+            response = self.post_image((100, 100))
+        self.assertEqual(response.status_code,
+                         status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        with self.settings(PRODUCT_UPLOAD_MEMORY_THRESHOLD=0):
+            response = self.post_image((100, 100))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Product.objects.count(), 1)
+
+
+class ProductSearchTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpass', email='test@test.com')
+        Product.objects.create(
+            user=self.user, title='Red bicycle', price=100,
+            description='Almost new')
+        Product.objects.create(
+            user=self.user, title='Table', price=100,
+            description='Wooden table')
+
+    def test_search_keeps_query_parameter(self):
+        response = self.client.get('/products/?search=bicyc')
+        self.assertEqual(
+            [product['title'] for product in response.data['results']],
+            ['Red bicycle'])
+        response = self.client.get('/products/?search=wooden')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_prefix_tsquery(self):
+        self.assertEqual(prefix_tsquery(['red', "bi'cy&|"]),
+                         'red:* & bi:* & cy:*')
+        self.assertEqual(prefix_tsquery(['!:*']), '')
+
+
+class ProductPaginationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpass', email='test@test.com')
+        Product.objects.bulk_create([
+            Product(user=self.user, title=f'Product {i}', price=100,
+                    description='This is a test product')
+            for i in range(25)])
+
+    def test_keyset_pages(self):
+        response = self.client.get('/products/')
+        first_page = [product['id'] for product in response.data['results']]
+        self.assertEqual(len(first_page), 20)
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get(response.data['next'])
+        second_page = [product['id'] for product in response.data['results']]
+        self.assertEqual(len(second_page), 5)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(first_page + second_page, sorted(
+            Product.objects.values_list('id', flat=True), reverse=True))
+
+    def test_page_numbers_are_opt_in(self):
+        response = self.client.get('/products/?page=2')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_ordering_by_ratings_uses_stored_counters(self):
+        first, second, third = Product.objects.order_by('id')[:3]
+        raters = [User.objects.create_user(
+            username=f'rater{i}', password='testpass',
+            email=f'rater{i}@test.com') for i in range(3)]
+        for rater in raters:
+            Rating.objects.create(user=rater, product=first, rate=3)
+        Rating.objects.create(user=raters[0], product=second, rate=5)
+        Rating.objects.create(user=raters[1], product=second, rate=4)
+        Rating.objects.create(user=raters[0], product=third, rate=1)
+
+        response = self.client.get('/products/?ordering=-ratings')
+        ids = [product['id'] for product in response.data['results']]
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(ids[:3], [second.id, first.id, third.id])
+        self.assertEqual(len(set(ids)), 20)
+        response = self.client.get('/products/?ordering=-ratings&page=2')
+        ids += [product['id'] for product in response.data['results']]
+        self.assertEqual(len(set(ids)), 25)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/products/?cursor=broken')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        for position in (['abc', 'x'], ['2026-10-18', None],
+                         [['2026-10-18'], 1]):
+            cursor = urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.client.get(f'/products/?cursor={cursor}')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecommendationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(
+            username='seller', password='testpass', email='seller@test.com')
+        self.users = [
+            User.objects.create_user(
+                username=f'user{i}', password='testpass',
+                email=f'user{i}@test.com')
+            for i in range(3)]
+        self.category = Category.objects.create(title='Test category')
+        self.products = [
+            Product.objects.create(
+                user=self.seller, title=f'Product {i}', price=100,
+                description='This is a test product')
+            for i in range(4)]
+        self.products[3].categories.add(self.category)
+        first, second, third, fourth = self.products
+        for user in self.users:
+            Order.objects.create(
+                user=user, product=first, address='Test address')
+        Like.objects.create(user=self.users[0], product=second)
+        Like.objects.create(user=self.users[1], product=third)
+        Like.objects.create(user=self.users[1], product=fourth)
+        Like.objects.create(user=self.users[2], product=third)
+
+    def get_ids(self, url='/products/recommendation/'):
+        return [product['id'] for product in self.client.get(url).data]
+
+    def test_counters_are_used_until_lists_are_built(self):
+        self.assertEqual(self.get_ids()[0], self.products[0].id)
+
+    def test_global_and_category_lists(self):
+        build_recommendations()
+        first, second, third, fourth = self.products
+        self.assertEqual(self.get_ids(),
+                         [first.id, third.id, fourth.id, second.id])
+        url = f'/products/recommendation/?category={self.category.id}'
+        self.assertEqual(self.get_ids(url), [fourth.id])
+
+    def test_personal_list_uses_neighbours(self):
+        build_recommendations()
+        first, second, third, fourth = self.products
+        self.client.force_authenticate(user=self.users[2])
+        self.assertEqual(self.get_ids(), [fourth.id, second.id])
+
+
+class LikeTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser', password='testpass', email='test@test.com')
+        self.products = [Product.objects.create(
+            user=self.user, title=f'Product {index}', price=100,
+            description='Test description') for index in range(3)]
+        self.client.force_authenticate(user=self.user)
+
+    def test_toggle_updates_counter(self):
+        url = f'/products/{self.products[0].id}/like/'
+        self.assertTrue(self.client.post(url).data['liked'])
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].likes_count, 1)
+
+        self.assertFalse(self.client.post(url).data['liked'])
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].likes_count, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_duplicate_likes_are_rejected(self):
+        Like.objects.create(user=self.user, product=self.products[0])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Like.objects.create(user=self.user, product=self.products[0])
+
+    def test_sync_applies_last_tap(self):
+        first, second, third = self.products
+        Like.objects.create(user=self.user, product=second)
+        response = self.client.post('/products/likes/sync/', {'likes': [
+            {'product': first.id, 'liked': False},
+            {'product': first.id, 'liked': True},
+            {'product': second.id, 'liked': False},
+            {'product': third.id, 'liked': True},
+            {'product': 0, 'liked': True},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['liked'], [first.id, third.id])
+        self.assertEqual(
+            dict(Product.objects.values_list('id', 'likes_count')),
+            {first.id: 1, second.id: 0, third.id: 1})
+
+    def test_sync_queries_do_not_depend_on_taps(self):
+        def sync_unlikes(products):
+            Like.objects.bulk_create([
+                Like(user=self.user, product=product) for product in products])
+            Product.objects.rebuild_counters()
+            with CaptureQueriesContext(connection) as queries:
+                sync_likes(self.user.id, [
+                    (product.id, False) for product in products])
+            return len(queries)
+
+        self.products += [Product.objects.create(
+            user=self.user, title=f'Product {index}', price=100,
+            description='Test description') for index in range(3, 30)]
+        self.assertEqual(sync_unlikes(self.products[:1]),
+                         sync_unlikes(self.products))
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Product.objects.filter(likes_count__gt=0).exists())
@@ -1,37 +1,89 @@
-from django.db.models import Count
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.parsers import JSONParser
 from rest_framework import status, generics, viewsets
 from django_filters.rest_framework.backends import DjangoFilterBackend
 
+from core.cache import cache_response, version_key
+from core.idempotency import idempotent
+from core.pagination import KeysetPagination
+from core.routers import ReplicaReadMixin
+from core.sparse import SparseFieldset
 from apps.orders.serializers import OrderSerializer
 from .serializers import (ProductSerializer, CommentSerializer, ProductListSerializer,
-                          CategorySerializer, RatingSerializer, LikeSerializer)
+                          CategorySerializer, RatingSerializer, LikeSyncSerializer)
 from .models import Product, Comment, Like, Category
 from .permissions import IsAuthor
+from .pagination import CommentPagination
 from .parsers import ProductParser
+from .filters import ProductSearchFilter, ProductOrderingFilter
+from .recommendations import get_recommendations
+from .likes import toggle_like, sync_likes
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+def products_version(view, request, *args, **kwargs):
+    return [version_key('products')]
+
+
+def product_version(view, request, *args, pk=None, **kwargs):
+    return [version_key('product', pk)]
+
+
+def recommendations_version(view, request, *args, **kwargs):
+    return [version_key('products'), version_key('recommendations')]
+
+
+def categories_version(view, request, *args, **kwargs):
+    return [version_key('categories')]
+
+
+def add_liked_flags(request, data):
+    """ Marks products liked by the caller on top of shared data """
+    if isinstance(data, dict):
+        products = data.get('results', [data])
+    else:
+        products = data
+
+    liked = set()
+    if request.user.is_authenticated and products:
+        liked = set(Like.objects
+                    .filter(user=request.user,
+                            product__in=[item['id'] for item in products])
+                    .values_list('product', flat=True))
+    for item in products:
+        item['is_liked'] = item['id'] in liked
+
+
+class ProductViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     parser_classes = (ProductParser,)
-    filter_backends = [SearchFilter, DjangoFilterBackend, OrderingFilter]
+    pagination_class = KeysetPagination
+    replica_actions = ('list', 'retrieve', 'recommendation', 'comments')
+    recommendations_size = 5
+    filter_backends = [ProductSearchFilter, DjangoFilterBackend,
+                       ProductOrderingFilter]
     filterset_fields = ['categories']
     search_fields = ['title', 'description']
     ordering_fields = ['ratings', 'created_at', 'price']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        sparse = SparseFieldset.from_request(self.request)
+        if self.action in ('list', 'recommendation', 'retrieve',
+                           'update', 'partial_update'):
+            return queryset.with_relations(sparse)
+        return queryset.select_related('user')
+
     def get_serializer_class(self):
         serializer_classes = {
             'list': ProductListSerializer,
             'order': OrderSerializer,
             'rate': RatingSerializer,
+            'comments': CommentSerializer,
             'comment_create': CommentSerializer,
-            'like': LikeSerializer,
+            'sync_likes': LikeSyncSerializer,
         }
         return serializer_classes.get(self.action, ProductSerializer)
 
@@ -41,26 +93,41 @@ class ProductViewSet(viewsets.ModelViewSet):
         else:
             return (IsAuthenticatedOrReadOnly(),)
 
-    @method_decorator(vary_on_cookie)
-    @method_decorator(cache_page(60*60))
-    def dispatch(self, request, *args, **kwargs):
-        return super().dispatch(request, *args, **kwargs)
-
-    @method_decorator(vary_on_cookie)
-    @method_decorator(cache_page(60*60))
+    @cache_response(products_version, shared=True,
+                    personalize=add_liked_flags)
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @cache_response(product_version, shared=True,
+                    personalize=add_liked_flags)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(['GET'], detail=False)
+    @cache_response(recommendations_version, personalize=add_liked_flags)
     def recommendation(self, request):
-        queryset = (self.get_queryset()
-                    .annotate(orders_count=Count('orders'))
-                    .order_by('-orders_count', 'ratings'))[:5]
+        category = request.query_params.get('category')
+        if category is not None and not category.isdigit():
+            raise ValidationError({'category': 'A valid integer is required.'})
+
+        ids = get_recommendations(
+            request.user, category, self.recommendations_size)
+        if ids is None:
+            # Nothing was built yet, rank by the stored counters instead
+            queryset = self.get_queryset()
+            if category is not None:
+                queryset = queryset.filter(categories=category)
+            queryset = (queryset.order_by('-orders_count', '-rating_sum')
+                        [:self.recommendations_size])
+        else:
+            products = self.get_queryset().in_bulk(ids)
+            queryset = [products[pk] for pk in ids if pk in products]
 
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
     @action(['POST'], detail=True)
+    @idempotent
     def order(self, request, pk=None):
         product = self.get_object()
         serializer = self.get_serializer(
@@ -71,6 +138,15 @@ class ProductViewSet(viewsets.ModelViewSet):
             {'message': f'Product {product.title} was ordered successfully'},
             status=status.HTTP_201_CREATED)
 
+    @action(['GET'], detail=True, pagination_class=CommentPagination)
+    @cache_response(product_version, shared=True)
+    def comments(self, request, pk=None):
+        product = self.get_object()
+        page = self.paginate_queryset(
+            product.comments.select_related('user'))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(['POST'], detail=True, url_path='comment')
     def comment_create(self, request, pk=None):
         product = self.get_object()
@@ -99,24 +175,43 @@ class ProductViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(['POST'], detail=True)
-    def like(self, request, pk=None) -> None:
+    def like(self, request, pk=None):
         product = self.get_object()
-        serializer = self.get_serializer(request.user, product)
-        return Response(serializer.data)
+        return Response({'liked': toggle_like(request.user.id, product.id)})
+
+    @action(['POST'], detail=False, url_path='likes/sync',
+            parser_classes=[JSONParser])
+    def sync_likes(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        liked = sync_likes(request.user.id, [
+            (tap['product'], tap['liked'])
+            for tap in serializer.validated_data['likes']])
+        return Response({'liked': liked})
 
 
-class CategoryList(generics.ListAPIView):
+class CategoryList(ReplicaReadMixin, generics.ListAPIView):
     serializer_class = CategorySerializer
+    replica_actions = ('get',)
     queryset = Category.objects.all()
 
+    @cache_response(categories_version, shared=True)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
-class FavoritesList(generics.ListAPIView):
+class FavoritesList(ReplicaReadMixin, generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = ProductSerializer
+    pagination_class = KeysetPagination
+    replica_actions = ('get',)
 
     def get_queryset(self):
         likes = (Like.objects
                  .filter(user=self.request.user)
                  .values_list('product'))
-        products = Product.objects.filter(id__in=likes)
+        products = (Product.objects
+                    .filter(id__in=likes)
+                    .with_relations(
+                        SparseFieldset.from_request(self.request)))
         return products
@@ -0,0 +1,133 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from knox.auth import TokenAuthentication
+from knox.models import AuthToken
+from knox.settings import knox_settings
+
+from core.cache import get_versions, version_key
+
+User = get_user_model()
+
+TOKEN_FIELDS = ('digest', 'token_key', 'user_id', 'created', 'expiry')
+
+
+def get_option(name):
+    return settings.AUTH_TOKEN_CACHE[name]
+
+
+def token_cache_key(token):
+    """ A fast hash of the raw token, the slow knox digest is not needed """
+    return 'auth:token:' + hashlib.sha256(token).hexdigest()
+
+
+def auth_version_key(user_id):
+    return version_key('auth', user_id)
+
+
+def user_fields():
+    """ The password hash stays out of the cache and loads on demand """
+    return [field.attname for field in User._meta.concrete_fields
+            if field.attname != 'password']
+
+
+class RefreshBuffer:
+    """
+    Collects expiry refreshes of this process and writes them in one
+    query. A lost batch only makes tokens expire a little earlier.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+
+    def add(self, digest, expiry):
+        with self.lock:
+            self.pending[digest] = expiry
+            if (len(self.pending) < get_option('BATCH_SIZE') and
+                    time.monotonic() - self.flushed_at
+                    < get_option('FLUSH_INTERVAL')):
+                return
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        if pending:
+            AuthToken.objects.bulk_update(
+                [AuthToken(digest=digest, expiry=expiry)
+                 for digest, expiry in pending.items()], ['expiry'])
+
+
+refresh_buffer = RefreshBuffer()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Knox authentication that keeps verified tokens and a snapshot of
+    their user in the cache. Deleting a token or saving the user bumps
+    the user's auth version, which drops every cached token of the user.
+    """
+
+    def authenticate_credentials(self, token):
+        key = token_cache_key(token)
+        entry = cache.get(key)
+        if entry is not None:
+            result = self.authenticate_cached(key, entry)
+            if result is not None:
+                return result
+
+        user, auth_token = super().authenticate_credentials(token)
+        self.cache_token(key, auth_token)
+        return user, auth_token
+
+    def authenticate_cached(self, key, entry):
+        version, = get_versions([auth_version_key(entry['token']['user_id'])])
+        expiry = entry['token']['expiry']
+        if entry['version'] != version or (expiry and expiry < timezone.now()):
+            cache.delete(key)
+            return None
+
+        if knox_settings.AUTO_REFRESH and expiry:
+            new_expiry = timezone.now() + knox_settings.TOKEN_TTL
+            delta = (new_expiry - expiry).total_seconds()
+            if delta > knox_settings.MIN_REFRESH_INTERVAL:
+                entry['token']['expiry'] = new_expiry
+                self.set_entry(key, entry)
+                refresh_buffer.add(entry['token']['digest'], new_expiry)
+
+        return self.validate_user(self.load_token(entry))
+
+    def cache_token(self, key, auth_token):
+        version, = get_versions([auth_version_key(auth_token.user_id)])
+        self.set_entry(key, {
+            'version': version,
+            'token': {field: getattr(auth_token, field)
+                      for field in TOKEN_FIELDS},
+            'user': {field: getattr(auth_token.user, field)
+                     for field in user_fields()},
+        })
+
+    def set_entry(self, key, entry):
+        timeout = get_option('TTL')
+        expiry = entry['token']['expiry']
+        if expiry:
+            timeout = min(timeout, (expiry - timezone.now()).total_seconds())
+        cache.set(key, entry, max(int(timeout), 1))
+
+    def load_token(self, entry):
+        """ Model instances built from the snapshot, without a query """
+        user = User.from_db(User.objects.db, list(entry['user']),
+                            list(entry['user'].values()))
+        auth_token = AuthToken.from_db(AuthToken.objects.db, TOKEN_FIELDS,
+                                       [entry['token'][field]
+                                        for field in TOKEN_FIELDS])
+        auth_token.user = user
+        return auth_token
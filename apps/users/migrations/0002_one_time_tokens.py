@@ -0,0 +1,64 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:54
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def move_activation_codes(apps, schema_editor):
+    """ Codes already sent by email keep working until they expire """
+    User = apps.get_model('users', 'CustomUser')
+    OneTimeToken = apps.get_model('users', 'OneTimeToken')
+
+    db_alias = schema_editor.connection.alias
+    now = timezone.now()
+    users = (User.objects
+             .using(db_alias)
+             .exclude(activation_code='')
+             .values_list('id', 'activation_code', 'is_active'))
+    tokens = []
+    for user_id, code, is_active in users.iterator():
+        # The same column held restore codes of already active users
+        purpose = 'PASSWORD_RESTORE' if is_active else 'ACTIVATION'
+        tokens.append(OneTimeToken(
+            purpose=purpose, target_id=user_id,
+            code_hash=hashlib.sha256(code.encode()).hexdigest(),
+            expires_at=now + settings.ONE_TIME_TOKEN_TTL[purpose]))
+    OneTimeToken.objects.using(db_alias).bulk_create(
+        tokens, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OneTimeToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(choices=[('ACTIVATION', 'Account activation'), ('PASSWORD_RESTORE', 'Password restore'), ('ORDER_CONFIRM', 'Order confirmation'), ('ORDER_COMPLETE', 'Order completion')], max_length=16)),
+                ('code_hash', models.CharField(max_length=64, unique=True)),
+                ('target_id', models.BigIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Одноразовый код',
+                'verbose_name_plural': 'Одноразовые коды',
+            },
+        ),
+        migrations.RunPython(move_activation_codes,
+                             migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='customuser',
+            name='activation_code',
+        ),
+        migrations.AddIndex(
+            model_name='onetimetoken',
+            index=models.Index(fields=['purpose', 'target_id'], name='users_oneti_purpose_0509ab_idx'),
+        ),
+    ]
@@ -1,5 +1,10 @@
-from django.db import models
+import hashlib
+
+from django.conf import settings
+from django.db import models, connection, transaction, IntegrityError
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
+from django.utils import timezone
+from django.utils.crypto import get_random_string
 
 
 class CustomUserManager(BaseUserManager):
@@ -28,7 +33,6 @@ class CustomUser(AbstractBaseUser):
     email = models.EmailField(unique=True)
     is_active = models.BooleanField(default=False)
     is_staff = models.BooleanField(default=False)
-    activation_code = models.CharField(max_length=10, blank=True)
 
     REQUIRED_FIELDS = ['email']
 
@@ -45,3 +49,70 @@ class CustomUser(AbstractBaseUser):
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+
+
+def hash_code(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+class OneTimeTokenManager(models.Manager):
+    def issue(self, purpose, target_id):
+        """ Replaces earlier tokens of the target, returns the raw code """
+        expires_at = timezone.now() + settings.ONE_TIME_TOKEN_TTL[purpose]
+        self.filter(purpose=purpose, target_id=target_id).delete()
+        while True:
+            code = get_random_string(10)
+            try:
+                with transaction.atomic():
+                    self.create(purpose=purpose, code_hash=hash_code(code),
+                                target_id=target_id, expires_at=expires_at)
+                return code
+            except IntegrityError:
+                continue
+
+    def consume(self, purpose, code, target_id=None):
+        """ Deletes a valid token and returns its target id, or None """
+        filters = {'purpose': purpose, 'code_hash': hash_code(code),
+                   'expires_at__gt': timezone.now()}
+        if target_id is not None:
+            filters['target_id'] = target_id
+
+        if connection.vendor == 'postgresql':
+            sql, params = self.filter(**filters).values('pk').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {self.model._meta.db_table} '
+                    f'WHERE id IN ({sql}) RETURNING target_id', params)
+                row = cursor.fetchone()
+            return row[0] if row else None
+
+        with transaction.atomic():
+            token = self.select_for_update().filter(**filters).first()
+            if token is None:
+                return None
+            token.delete()
+        return token.target_id
+
+
+class OneTimeToken(models.Model):
+    PURPOSE_CHOISES = (
+        ('ACTIVATION', 'Account activation'),
+        ('PASSWORD_RESTORE', 'Password restore'),
+        ('ORDER_CONFIRM', 'Order confirmation'),
+        ('ORDER_COMPLETE', 'Order completion'),
+    )
+
+    purpose = models.CharField(max_length=16, choices=PURPOSE_CHOISES)
+    code_hash = models.CharField(max_length=64, unique=True)
+    target_id = models.BigIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = OneTimeTokenManager()
+
+    class Meta:
+        verbose_name = 'Одноразовый код'
+        verbose_name_plural = 'Одноразовые коды'
+        indexes = [models.Index(fields=['purpose', 'target_id'])]
+
+    def __str__(self) -> str:
+        return f'{self.get_purpose_display()} для {self.target_id}'
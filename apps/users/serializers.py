@@ -1,7 +1,9 @@
 from django.contrib.auth import get_user_model, authenticate
+from django.db import transaction
 from rest_framework import serializers
 
-from .utils import create_activation_code, password_confirmation
+from .models import OneTimeToken
+from .utils import password_confirmation
 from .tasks import send_activation_email
 
 
@@ -28,9 +30,10 @@ class RegistrationSerializer(serializers.ModelSerializer):
         return email
 
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
-        create_activation_code(user)
-        send_activation_email.delay(user.id)
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
+            code = OneTimeToken.objects.issue('ACTIVATION', user.id)
+            send_activation_email.delay_on_commit(user.id, code)
         return user
 
 
@@ -38,17 +41,17 @@ class ActivationSerializer(serializers.Serializer):
     activation_code = serializers.CharField(max_length=10)
 
     def validate_activation_code(self, activation_code: str):
-        if not User.objects.filter(activation_code=activation_code).exists():
+        self.user_id = OneTimeToken.objects.consume(
+            'ACTIVATION', activation_code)
+        if self.user_id is None:
             raise serializers.ValidationError(
                 'The activation code is not correct!')
         return activation_code
 
     def activate(self):
-        code = self.validated_data.get('activation_code')
-        user = User.objects.get(activation_code=code)
+        user = User.objects.get(pk=self.user_id)
         user.is_active = True
-        user.activation_code = ''
-        user.save()
+        user.save(update_fields=['is_active'])
 
 
 class LoginSerializer(serializers.Serializer):
@@ -96,10 +99,11 @@ class PasswordRestoreSerializer(serializers.Serializer):
         password_confirmation(attrs.get('new_pwd'),
                               attrs.get('new_pwd_conf'))
         user = self.context.get('request').user
-        if user.activation_code != attrs.get('activation_code'):
+        if OneTimeToken.objects.consume('PASSWORD_RESTORE',
+                                        attrs.get('activation_code'),
+                                        target_id=user.id) is None:
             raise serializers.ValidationError('Restore code is not correct')
         user.set_password(attrs.get('new_pwd'))
-        user.activation_code = ''
         user.save()
         return attrs
 
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from knox.models import AuthToken
+
+from core.cache import bump_versions
+from .authentication import auth_version_key
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    bump_versions([auth_version_key(instance.pk)])
+
+
+@receiver(post_delete, sender=AuthToken)
+def token_deleted(sender, instance, **kwargs):
+    bump_versions([auth_version_key(instance.user_id)])
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    if user is not None:
+        bump_versions([auth_version_key(user.pk)])
@@ -1,45 +1,48 @@
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
 from django.urls import reverse
 from django.conf import settings
+from django.utils import timezone
 from celery import shared_task
 
 from core.celery import LogErrorsTask
+from apps.notifications.utils import enqueue_email
+from .models import OneTimeToken
 
 
 User = get_user_model()
 
 
-@shared_task(base=LogErrorsTask)
-def send_activation_email(user_id):
+@shared_task(base=LogErrorsTask, max_queries=2)
+def send_activation_email(user_id, activation_code):
     user = User.objects.get(pk=user_id)
-    activation_url = reverse('activate', args=[user.activation_code])
+    activation_url = reverse('activate', args=[activation_code])
     activation_link = f"{settings.BASE_URL}{activation_url}"
     subject = 'Activate Your Account'
     message = f"""
     Hello {user.username},
     please click the following link to activate your account: {activation_link}"""
-    send_mail(
+    enqueue_email(
         subject=subject,
         message=message,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=[user.email],
-        fail_silently=False
+        recipient_list=[user.email]
     )
 
 
-@shared_task(base=LogErrorsTask)
-def send_password_restore(user_id):
+@shared_task(base=LogErrorsTask, max_queries=2)
+def send_password_restore(user_id, activation_code):
     user = User.objects.get(pk=user_id)
-    activation_code = user.activation_code
     subject = 'Restoring password'
     message = f"""
     Hello {user.username},
     here is your activation code for restoring password: {activation_code}"""
-    send_mail(
+    enqueue_email(
         subject=subject,
         message=message,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=[user.email],
-        fail_silently=False
+        recipient_list=[user.email]
     )
+
+
+@shared_task(base=LogErrorsTask)
+def purge_expired_tokens():
+    """ Tokens have no relations or signals, so this is a single DELETE """
+    OneTimeToken.objects.filter(expires_at__lte=timezone.now()).delete()
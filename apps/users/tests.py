@@ -1,17 +1,24 @@
+from datetime import timedelta
+
 from django.test import TestCase
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from knox.models import AuthToken
 
+from .authentication import refresh_buffer, token_cache_key
+from .models import OneTimeToken
+from .tasks import purge_expired_tokens
+
 User = get_user_model()
 
 
 def create_test_user():
     user = User.objects.create_user(
             username='testuser', email='testuser@example.com',
-            password='testpass', is_active = True,
-            activation_code='test-code'
+            password='testpass', is_active = True
     )
     return user
 
@@ -40,8 +47,9 @@ class ActivateTestCase(TestCase):
         self.client = APIClient()
         self.user = create_test_user()
         self.user.is_active = False
+        self.user.save()
         self.activation_url = reverse(
-            'activate', args=[self.user.activation_code])
+            'activate', args=[OneTimeToken.objects.issue('ACTIVATION', self.user.id)])
 
     def test_activation(self):
         response = self.client.get(self.activation_url)
@@ -50,6 +58,12 @@ class ActivateTestCase(TestCase):
         self.user.refresh_from_db()
         self.assertTrue(self.user.is_active)
 
+    def test_code_is_consumed(self):
+        self.client.get(self.activation_url)
+        response = self.client.get(self.activation_url)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OneTimeToken.objects.exists())
+
 
 class LoginTestCase(TestCase):
     def setUp(self):
@@ -97,12 +111,79 @@ class PwdRestoreTestCase(TestCase):
         self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
 
     def test_update(self):
+        code = OneTimeToken.objects.issue('PASSWORD_RESTORE', self.user.id)
         responce = self.client.patch('/accounts/restore-password/', {
-            'activation_code': 'test-code',
+            'activation_code': code,
             'new_pwd': 'testpass2',
             'new_pwd_conf': 'testpass2'
         })
         self.assertEqual(responce.status_code, 200)
 
         self.user.refresh_from_db()
-        self.assertTrue(self.user.check_password('testpass2'))    
+        self.assertTrue(self.user.check_password('testpass2'))
+
+
+class OneTimeTokenTestCase(TestCase):
+    def test_code_is_stored_hashed(self):
+        code = OneTimeToken.objects.issue('ACTIVATION', 1)
+        token = OneTimeToken.objects.get()
+        self.assertNotEqual(token.code_hash, code)
+        self.assertEqual(len(token.code_hash), 64)
+
+    def test_new_code_replaces_old(self):
+        old = OneTimeToken.objects.issue('ACTIVATION', 1)
+        new = OneTimeToken.objects.issue('ACTIVATION', 1)
+        self.assertIsNone(OneTimeToken.objects.consume('ACTIVATION', old))
+        self.assertIsNone(OneTimeToken.objects.consume('PASSWORD_RESTORE', new))
+        self.assertEqual(OneTimeToken.objects.consume('ACTIVATION', new), 1)
+
+    def test_expired_tokens(self):
+        code = OneTimeToken.objects.issue('ACTIVATION', 1)
+        OneTimeToken.objects.update(expires_at=timezone.now())
+        self.assertIsNone(OneTimeToken.objects.consume('ACTIVATION', code))
+        purge_expired_tokens()
+        self.assertFalse(OneTimeToken.objects.exists())
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_test_user()
+        self.instance, self.token = AuthToken.objects.create(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def test_cached_token_skips_database(self):
+        self.assertEqual(self.client.get('/accounts/').status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get('/accounts/')
+        self.assertEqual(response.data['username'], 'testuser')
+
+    def test_logout_invalidates_cache(self):
+        self.client.get('/accounts/')
+        self.assertEqual(self.client.post('/accounts/logout/').status_code, 204)
+        self.assertEqual(self.client.get('/accounts/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/accounts/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/accounts/').status_code, 401)
+
+    def test_refreshes_are_written_in_batches(self):
+        self.client.get('/accounts/')
+        expiry = timezone.now() + timedelta(hours=1)
+        AuthToken.objects.filter(pk=self.instance.pk).update(expiry=expiry)
+        key = token_cache_key(self.token.encode())
+        entry = cache.get(key)
+        entry['token']['expiry'] = expiry
+        cache.set(key, entry)
+
+        with self.assertNumQueries(0):
+            self.client.get('/accounts/')
+        self.instance.refresh_from_db()
+        self.assertEqual(self.instance.expiry, expiry)
+
+        refresh_buffer.flush()
+        self.instance.refresh_from_db()
+        self.assertGreater(self.instance.expiry, expiry + timedelta(hours=8))
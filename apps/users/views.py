@@ -11,7 +11,7 @@ from knox.settings import knox_settings
 from .serializers import (RegistrationSerializer, ActivationSerializer,
                           LoginSerializer, PasswordUpdateSerializer,
                           PasswordRestoreSerializer, UserSerializer)
-from .utils import create_activation_code
+from .models import OneTimeToken
 from .tasks import send_password_restore
 
 User = get_user_model()
@@ -95,8 +95,8 @@ class PasswordRestore(generics.GenericAPIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request: Request) -> Response:
-        create_activation_code(request.user)
-        send_password_restore.delay(request.user.id)
+        code = OneTimeToken.objects.issue('PASSWORD_RESTORE', request.user.id)
+        send_password_restore.delay_on_commit(request.user.id, code)
         return Response(
             {'message': 'Your restore code was sent to your email'},
             status=status.HTTP_200_OK)
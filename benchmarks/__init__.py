@@ -0,0 +1,8 @@
+"""
+Benchmarks of the marketplace API.
+
+    python -m benchmarks                  # compare with baseline.json
+    python -m benchmarks --save-baseline  # store the current numbers
+
+Data is seeded into a throwaway test database, the real one is untouched.
+"""
@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import django
+
+BASELINE = Path(__file__).with_name('baseline.json')
+COLUMNS = ('p50_ms', 'p95_ms', 'queries', 'peak_kib')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Seeds a test database and measures the API.')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--interactions', type=int, default=2000,
+                        help='comments, ratings and likes each, half as many orders')
+    parser.add_argument('--requests', type=int, default=30,
+                        help='requests per scenario')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed latency growth over the baseline')
+    parser.add_argument('--keepdb', action='store_true',
+                        help='reuse the seeded database of a previous run')
+    return parser.parse_args(argv)
+
+
+def compare(results, baseline, tolerance):
+    """ Rows with the change against the baseline, and the regressions """
+    rows, regressions = [], []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        cells = []
+        for column in COLUMNS:
+            value = result[column]
+            if previous and previous.get(column):
+                change = (value - previous[column]) / previous[column]
+                cells.append(f'{value} ({change:+.0%})')
+            else:
+                cells.append(str(value))
+        rows.append((name, *cells))
+
+        if previous is None:
+            continue
+        if result['queries'] > previous['queries']:
+            regressions.append(
+                f"{name}: {previous['queries']} -> {result['queries']} queries")
+        if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {previous['p95_ms']} -> {result['p95_ms']} ms")
+    return rows, regressions
+
+
+def print_table(rows):
+    header = ('scenario', *COLUMNS)
+    widths = [max(len(str(row[index])) for row in (header, *rows))
+              for index in range(len(header))]
+    for row in (header, *rows):
+        print('  '.join(str(cell).ljust(width)
+                        for cell, width in zip(row, widths)))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import (setup_test_environment,
+                                   teardown_test_environment)
+    from knox.models import AuthToken
+    from rest_framework.test import APIClient
+
+    from apps.products.models import Product
+    from .scenarios import run
+    from .seed import busiest_user, seed
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(
+        verbosity=0, keepdb=args.keepdb)
+    try:
+        if not Product.objects.exists():
+            seed(users=args.users, products=args.products,
+                 comments=args.interactions, ratings=args.interactions,
+                 likes=args.interactions, orders=args.interactions // 2)
+
+        user = busiest_user()
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION='Token ' + AuthToken.objects.create(user)[1])
+        context = {'product_id': Product.objects.order_by('-orders_count',
+                                                          'id')[0].pk}
+        results = run(client, context, args.requests)
+    finally:
+        connection.creation.destroy_test_db(
+            old_name, verbosity=0, keepdb=args.keepdb)
+        teardown_test_environment()
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=4) + '\n')
+        print_table([(name, *(result[column] for column in COLUMNS))
+                     for name, result in results.items()])
+        print(f'\nBaseline saved to {args.baseline}')
+        return 0
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+    rows, regressions = compare(results, baseline, args.tolerance)
+    print_table(rows)
+    if regressions:
+        print('\nRegressions:\n  ' + '\n  '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import statistics
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# name -> path, `context` holds ids of the seeded data
+SCENARIOS = {
+    'product list': lambda context: '/products/',
+    'product list (sparse)': lambda context: (
+        '/products/?fields=title,price,images&expand=none'),
+    'product detail': lambda context: f"/products/{context['product_id']}/",
+    'product comments': lambda context: (
+        f"/products/{context['product_id']}/comments/"),
+    'recommendations': lambda context: '/products/recommendation/',
+    'active orders': lambda context: '/orders/active/',
+    'owner orders': lambda context: '/accounts/orders/',
+    'favorites': lambda context: '/accounts/favorites/',
+}
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+def measure(client, path, requests, cold):
+    """
+    Cold requests start from an empty cache, so they include the token
+    lookup and every query of the view; warm ones show the cached path.
+    """
+    timings, queries = [], []
+    if not cold:
+        client.get(path)
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(path)
+            timings.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {path} returned {response.status_code}')
+        queries.append(len(captured))
+
+    # Tracing slows everything down, so memory is measured separately
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    client.get(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'queries': max(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run(client, context, requests):
+    results = {}
+    for name, path in SCENARIOS.items():
+        for mode in ('cold', 'warm'):
+            results[f'{name} ({mode})'] = measure(
+                client, path(context), requests, cold=mode == 'cold')
+    return results
@@ -0,0 +1,83 @@
+import random
+from itertools import product as pairs
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db.models import Count
+
+from apps.orders.models import Order
+from apps.products.models import Category, Comment, Like, Product, Rating
+from apps.products.recommendations import build_recommendations
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+def unique_pairs(users, products, count, rng):
+    """ Distinct (user, product) pairs, nobody interacts with own products """
+    candidates = [(user, product) for user, product in pairs(users, products)
+                  if product.user_id != user.pk]
+    return rng.sample(candidates, min(count, len(candidates)))
+
+
+def seed(users=50, products=500, categories=10, comments=2000,
+         ratings=2000, likes=2000, orders=1000, random_seed=0):
+    """ Fills the database with bulk inserts, signals are not sent """
+    rng = random.Random(random_seed)
+    password = make_password('benchmark')
+
+    User.objects.bulk_create(
+        (User(username=f'user{index}', email=f'user{index}@example.com',
+              password=password, is_active=True)
+         for index in range(users)), batch_size=BATCH_SIZE)
+    users = list(User.objects.order_by('id'))
+
+    Category.objects.bulk_create(
+        Category(title=f'Category {index}') for index in range(categories))
+    categories = list(Category.objects.all())
+
+    Product.objects.bulk_create(
+        (Product(user=rng.choice(users), title=f'Product {index}',
+                 description=f'Description of product {index}',
+                 price=rng.randint(1, 10000))
+         for index in range(products)), batch_size=BATCH_SIZE)
+    products = list(Product.objects.all())
+
+    Membership = Product.categories.through
+    Membership.objects.bulk_create(
+        (Membership(product=product, category=category)
+         for product in products
+         for category in rng.sample(categories, min(2, len(categories)))),
+        batch_size=BATCH_SIZE)
+
+    Comment.objects.bulk_create(
+        (Comment(user=rng.choice(users), product=rng.choice(products),
+                 text='Benchmark comment')
+         for _ in range(comments)), batch_size=BATCH_SIZE)
+    Rating.objects.bulk_create(
+        (Rating(user=user, product=product, rate=rng.randint(1, 5))
+         for user, product in unique_pairs(users, products, ratings, rng)),
+        batch_size=BATCH_SIZE)
+    Like.objects.bulk_create(
+        (Like(user=user, product=product)
+         for user, product in unique_pairs(users, products, likes, rng)),
+        batch_size=BATCH_SIZE)
+
+    statuses = [status for status, _ in Order.STATUS_CHOISES]
+    Order.objects.bulk_create(
+        (Order(user=user, product=product, address='Benchmark address',
+               status=rng.choice(statuses))
+         for user, product in unique_pairs(users, products, orders, rng)),
+        batch_size=BATCH_SIZE)
+
+    Product.objects.rebuild_counters()
+    build_recommendations()
+
+
+def busiest_user():
+    """ The user with the most orders, so every page has content """
+    return (User.objects
+            .annotate(orders_total=Count('orders'))
+            .order_by('-orders_total', 'id')
+            .first())
@@ -0,0 +1,116 @@
+import time
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+from .routers import reading_from_replica
+
+
+def version_key(scope, pk=''):
+    return f'version:{scope}:{pk}'
+
+
+def new_version():
+    """ Time based, so a lost counter never reuses an old version """
+    return time.time_ns()
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bumped_key(key):
+    return f'{key}:bumped'
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), None)
+    cache.set_many({bumped_key(key): True for key in keys},
+                   settings.REPLICA_PIN_SECONDS)
+
+
+def recently_bumped(keys):
+    """ Replicas may not have the write behind a bump for this long """
+    return bool(keys) and bool(
+        cache.get_many([bumped_key(key) for key in keys]))
+
+
+def bump_versions(keys):
+    """ Bumps now and again after commit, so a response cached from
+    a read that raced the transaction is dropped as well """
+    keys = set(keys)
+    _bump(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(keys))
+
+
+def normalized_query(request):
+    """ Same parameters in any order and without empty values match """
+    return urlencode(sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values if value))
+
+
+def response_cache_key(request, versions, shared=False):
+    user_id = ''
+    if not shared and request.user.is_authenticated:
+        user_id = request.user.pk
+    raw_key = ':'.join(map(str, (
+        request.path, normalized_query(request), user_id, *versions)))
+    return 'response:' + hashlib.md5(raw_key.encode()).hexdigest()
+
+
+def cache_response(versions=None, timeout=None, shared=False,
+                   personalize=None):
+    """
+    Caches response data of a DRF view method. `versions` gets the same
+    arguments as the view and returns the version keys the data depends
+    on, so bumping any of them makes the cached data unreachable.
+
+    Shared responses are cached once for all callers, `personalize` then
+    adds the caller specific fields to every response, cached or not.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            keys = versions(view, request, *args, **kwargs) if versions else []
+            key = response_cache_key(request, get_versions(keys), shared)
+            data = cache.get(key)
+            metrics.record_cache(data is not None)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = view_method(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                ttl = timeout or settings.RESPONSE_CACHE_TTL
+                replica = reading_from_replica()
+                if replica:
+                    ttl = min(ttl, settings.REPLICA_RESPONSE_CACHE_TTL)
+                # A lagging replica would store old rows under the new
+                # version, and pinned writers would read them from there
+                if not (replica and recently_bumped(keys)):
+                    cache.set(key, response.data, ttl)
+
+            if personalize:
+                personalize(request, response.data)
+            return response
+        return wrapper
+    return decorator
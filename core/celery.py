@@ -1,9 +1,13 @@
 import os
 import logging
 
+from django.conf import settings
 from django.core.management import call_command
+from django.db import connection, transaction
+from django.dispatch import Signal
 from celery import Task
 from celery import Celery
+from celery.signals import celeryd_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
@@ -16,11 +20,50 @@ app.autodiscover_tasks()
 
 logger = logging.getLogger('main')
 
+
+@celeryd_init.connect
+def configure_worker_connections(**kwargs):
+    """ Workers run many short tasks, so they keep connections longer """
+    for database in settings.DATABASES.values():
+        database['CONN_MAX_AGE'] = settings.CELERY_DB_CONN_MAX_AGE
+
+
+# Sent after every LogErrorsTask run with the number of queries it made
+task_queries_counted = Signal()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
 class LogErrorsTask(Task):
+    # Query budget of a single run, exceeding it is logged
+    max_queries = None
+
+    def __call__(self, *args, **kwargs):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            result = super().__call__(*args, **kwargs)
+        task_queries_counted.send(sender=self, count=counter.count)
+        if self.max_queries is not None and counter.count > self.max_queries:
+            logger.warning('Celery task %s made %d queries, budget is %d',
+                           self.name, counter.count, self.max_queries)
+        return result
+
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         logger.exception('Celery task failed: %s', str(exc), exc_info=False)
         super(LogErrorsTask, self).on_failure(exc, task_id, args, kwargs, einfo)
 
+    def delay_on_commit(self, *args, **kwargs):
+        """ Enqueues the task once the current transaction is committed,
+        so the worker never reads rows that are not visible yet """
+        transaction.on_commit(lambda: self.delay(*args, **kwargs))
+
 @app.task
 def run_tests():
     call_command('test')
@@ -0,0 +1,80 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = sorted(data.lists())
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def idempotency_cache_key(request, key):
+    raw_key = ':'.join(map(str, (
+        request.user.pk, request.method, request.path, key)))
+    return 'idempotency:' + hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+def replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response(
+            {'detail': f'{HEADER} was used with a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return Response(stored['data'], status=stored['status'],
+                    headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view_method):
+    """
+    Replays the stored response when a client retries a DRF view method
+    with the same Idempotency-Key, so the work is done only once. A retry
+    that arrives while the first request still runs gets 409, reusing the
+    key with a different payload gets 422.
+    """
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': f'{HEADER} is too long.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = idempotency_cache_key(request, key)
+        fingerprint = request_fingerprint(request)
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return replay(stored, fingerprint)
+
+        if not cache.add(cache_key + ':lock', True,
+                         settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return Response(
+                {'detail': 'A request with this key is in progress.'},
+                status=status.HTTP_409_CONFLICT)
+        try:
+            # The first request may have finished between the read above
+            # and taking the lock
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return replay(stored, fingerprint)
+            response = view_method(view, request, *args, **kwargs)
+            if response.status_code < 500:
+                cache.set(cache_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                }, settings.IDEMPOTENCY_KEY_TTL)
+        finally:
+            cache.delete(cache_key + ':lock')
+        return response
+    return wrapper
@@ -0,0 +1,107 @@
+import json
+import random
+import time
+from logging import Filter, Formatter, WARNING
+from logging.handlers import (MemoryHandler, QueueHandler, QueueListener,
+                              RotatingFileHandler)
+from queue import Empty, SimpleQueue
+
+
+class JsonFormatter(Formatter):
+    """ One JSON object per line, fields passed as `extra={'activity': ...}` """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'activity', {}))
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(Filter):
+    """ Keeps a share of the records, warnings and server errors always pass """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= WARNING:
+            return True
+        if getattr(record, 'activity', {}).get('status', 0) >= 500:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class BatchingHandler(MemoryHandler):
+    """ Flushes when the batch is full, on errors or when it gets old """
+
+    def __init__(self, capacity, flush_interval, **kwargs):
+        super().__init__(capacity, **kwargs)
+        self.flush_interval = flush_interval
+        self.flushed_at = time.monotonic()
+
+    def shouldFlush(self, record):
+        return (super().shouldFlush(record) or
+                time.monotonic() - self.flushed_at >= self.flush_interval)
+
+    def flush(self):
+        super().flush()
+        self.flushed_at = time.monotonic()
+
+
+class BatchingListener(QueueListener):
+    """ Flushes the handlers when no record arrives for `flush_interval`,
+    so an idle process doesn't keep its last batch in memory """
+
+    def __init__(self, queue, *handlers, flush_interval):
+        super().__init__(queue, *handlers)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        if not block:
+            return super().dequeue(block)
+        while True:
+            try:
+                return self.queue.get(timeout=self.flush_interval)
+            except Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Puts records on a queue, a listener thread formats them and writes
+    them in batches to a rotating file, so requests never wait on disk.
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 capacity=100, flush_interval=5):
+        super().__init__(SimpleQueue())
+        self.target = RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count,
+            delay=True)
+        self.buffer = BatchingHandler(
+            capacity, flush_interval, target=self.target)
+        self.listener = BatchingListener(
+            self.queue, self.buffer, flush_interval=flush_interval)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """ Formatting is left to the listener thread """
+        return record
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.buffer.close()
+        self.target.close()
+        super().close()
@@ -0,0 +1,203 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from rest_framework import serializers
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request wall time'),
+    'http_requests_total': ('counter', 'Finished requests'),
+    'db_queries_per_request': ('histogram', 'Database queries per request'),
+    'db_duration_seconds': ('histogram', 'Database time per request'),
+    'serializer_duration_seconds': ('histogram', 'Serializer time per request'),
+    'response_cache_hits_total': ('counter', 'Cached responses served'),
+    'response_cache_misses_total': ('counter', 'Responses built on a cache miss'),
+}
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """ Numbers of one request, also the execute wrapper counting its queries """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def server_timing(self, duration):
+        return ', '.join((
+            f'db;desc="{self.queries} queries";dur={self.db_time * 1000:.2f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'serializer;dur={self.serializer_time * 1000:.2f}',
+            f'total;dur={duration * 1000:.2f}',
+        ))
+
+
+def activate(request_metrics):
+    return _current.set(request_metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def record_cache(hit):
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return
+    if hit:
+        request_metrics.cache_hits += 1
+    else:
+        request_metrics.cache_misses += 1
+
+
+@contextmanager
+def serializer_timer():
+    """ Only the outermost serializer is timed, nested ones are part of it """
+    request_metrics = _current.get()
+    if request_metrics is None:
+        yield
+        return
+
+    request_metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.serializer_depth -= 1
+        if not request_metrics.serializer_depth:
+            request_metrics.serializer_time += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    """ Time spent building `.data` counts as serializer time, lists
+    need `list_serializer_class = TimedListSerializer` in Meta """
+
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class Histogram:
+    """ Fixed buckets, so memory does not grow with traffic """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+def format_labels(labels, **extra):
+    labels = {**dict(labels), **extra}
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels.items())
+
+
+class Registry:
+    """
+    In-process aggregates per route and action. Labels come from resolved
+    URL names only, so the number of series is bounded by the URL conf.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        with self.lock:
+            histogram = self.histograms.setdefault((name, labels),
+                                                   Histogram(buckets))
+            histogram.observe(value)
+
+    def inc(self, name, labels, value=1):
+        if not value:
+            return
+        with self.lock:
+            self.counters[name, labels] = (
+                self.counters.get((name, labels), 0) + value)
+
+    def observe_request(self, labels, status, duration, request_metrics):
+        self.observe('http_request_duration_seconds', labels, duration)
+        self.inc('http_requests_total', labels + (('status', status),))
+        self.observe('db_queries_per_request', labels,
+                     request_metrics.queries, QUERY_BUCKETS)
+        self.observe('db_duration_seconds', labels, request_metrics.db_time)
+        self.observe('serializer_duration_seconds', labels,
+                     request_metrics.serializer_time)
+        self.inc('response_cache_hits_total', labels,
+                 request_metrics.cache_hits)
+        self.inc('response_cache_misses_total', labels,
+                 request_metrics.cache_misses)
+
+    def render(self):
+        """ Prometheus text exposition format """
+        with self.lock:
+            histograms = {key: (list(value.samples()), value.sum)
+                          for key, value in self.histograms.items()}
+            counters = dict(self.counters)
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+            for (metric, labels), value in sorted(counters.items(), key=str):
+                if metric == name:
+                    lines.append(f'{name}{{{format_labels(labels)}}} {value}')
+            for (metric, labels), (samples, total) in sorted(
+                    histograms.items(), key=str):
+                if metric != name:
+                    continue
+                for bound, count in samples:
+                    lines.append(
+                        f'{name}_bucket{{{format_labels(labels, le=bound)}}} '
+                        f'{count}')
+                lines.append(f'{name}_sum{{{format_labels(labels)}}} {total}')
+                lines.append(f'{name}_count{{{format_labels(labels)}}} '
+                             f'{samples[-1][1]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def request_labels(request):
+    match = request.resolver_match
+    if match is None:
+        return (('route', 'unresolved'), ('action', ''))
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return (('route', match.view_name), ('action', action))
@@ -1,14 +1,77 @@
 import logging
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+from .routers import pin_to_primary, routing_state
 
 logger = logging.getLogger('user_logger')
 
+
+class PerformanceMiddleware:
+    """ Times every request, counts its queries and cache lookups and
+    reports them in the Server-Timing header and the metrics registry """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.activate(request_metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(request_metrics))
+                response = self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+
+        duration = time.perf_counter() - started
+        metrics.registry.observe_request(
+            metrics.request_labels(request), response.status_code,
+            duration, request_metrics)
+        response['Server-Timing'] = request_metrics.server_timing(duration)
+        return response
+
+
+class PrimaryPinMiddleware:
+    """ Pins a user to the primary database for a few seconds after
+    a request of theirs wrote something, so they see their own changes """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing_state() as state:
+            response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if state.wrote and user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+        return response
+
+
 class LogUserActivityMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
+        if not logger.isEnabledFor(logging.INFO):
+            return self.get_response(request)
+
+        started = time.perf_counter()
         response = self.get_response(request)
-        
+
         if request.user.is_authenticated:
-            logger.info(f"{request.user.username} accessed {request.method} {request.path}")
+            match = request.resolver_match
+            logger.info('request', extra={'activity': {
+                'user_id': request.user.pk,
+                'method': request.method,
+                'route': match.view_name if match else None,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+            }})
         return response
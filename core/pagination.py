@@ -0,0 +1,111 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_filter(ordering, values):
+    """ Rows after `values` in `ordering`: (a < x) or (a = x and b < y) """
+    condition = Q()
+    for index, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[index]})
+        for previous, value in zip(ordering[:index], values[:index]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seeks to the next page by the (created_at, id) of the last row instead
+    of counting and skipping rows. Clients that need totals can opt in to
+    page numbers with `?page=`, custom ordering or search does the same.
+    """
+    page_size = api_settings.PAGE_SIZE
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_number_params = ('page', api_settings.ORDERING_PARAM,
+                          api_settings.SEARCH_PARAM)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_number_pagination = None
+        if any(request.query_params.get(param)
+               for param in self.page_number_params):
+            self.page_number_pagination = PageNumberPagination()
+            return self.page_number_pagination.paginate_queryset(
+                queryset, request, view)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, position))
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_position(self, instance):
+        return [str(getattr(instance, field.lstrip('-')))
+                for field in self.ordering]
+
+    def decode_cursor(self, request, model):
+        """ Cursor values converted to the types of the ordering fields """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError, DecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [model._meta.get_field(field.lstrip('-')).to_python(value)
+                      for field, value in zip(self.ordering, position)]
+        except (DjangoValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, position):
+        encoded = urlsafe_b64encode(json.dumps(position).encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        if self.page_number_pagination:
+            return self.page_number_pagination.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
@@ -0,0 +1,114 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+# The replica chosen for the current request, or None for the primary
+_replica_reads = ContextVar('replica_reads', default=None)
+_request_state = ContextVar('routing_state', default=None)
+
+# Token expiry refreshes are written while authenticating any request,
+# they must not pin the user to the primary
+UNTRACKED_WRITES = {'knox.authtoken'}
+
+
+class RoutingState:
+    """ Per request: once anything is written, reads stay on the primary """
+
+    def __init__(self):
+        self.wrote = False
+
+
+def pin_key(user_id):
+    return f'routing:pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id), False)
+
+
+def choose_replica():
+    """ Picked once, so all reads of a request see the same lag """
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def reading_from_replica():
+    state = _request_state.get()
+    return (_replica_reads.get() is not None and
+            not (state and state.wrote))
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(choose_replica())
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def routing_state():
+    state = RoutingState()
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads go to the replica chosen for `replica_reads()` and until the
+    request writes, everything else uses the primary. Replicas hold the
+    same data, so relations across aliases are allowed.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return _replica_reads.get()
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if (state is not None and
+                model._meta.label_lower not in UNTRACKED_WRITES):
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Safe requests to `replica_actions` of a view read from a replica,
+    unless the user wrote something a moment ago. Generic views use the
+    lowercase method name as the action.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication has already run on the primary
+        super().initial(request, *args, **kwargs)
+        action = getattr(self, 'action', request.method.lower())
+        if (request.method in SAFE_METHODS and
+                action in self.replica_actions and
+                not (request.user.is_authenticated and
+                     is_pinned(request.user.pk))):
+            self.replica_token = _replica_reads.set(choose_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, 'replica_token', None) is not None:
+            _replica_reads.reset(self.replica_token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -2,7 +2,7 @@ import os
 from datetime import timedelta
 from pathlib import Path
 import sys
-from decouple import config
+from decouple import config, Csv
 
 from celery.schedules import crontab
 
@@ -39,9 +39,12 @@ INSTALLED_APPS = [
     'apps.users',
     'apps.products',
     'apps.orders',
+    'apps.notifications',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
+    'core.middleware.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,9 +86,30 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        # Persistent connections, checked before reuse after a request
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        # pgbouncer in transaction mode can't keep server-side cursors
+        'DISABLE_SERVER_SIDE_CURSORS': config(
+            'DB_PGBOUNCER', default=False, cast=bool),
     }
 }
 
+for index, host in enumerate(
+        config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.routers.PrimaryReplicaRouter']
+# Responses built from a lagging replica are not kept for long
+REPLICA_RESPONSE_CACHE_TTL = 60 * 5
+# Users read from the primary for a while after they wrote something
+REPLICA_PIN_SECONDS = 10
+
 
 # Cache settings
 
@@ -97,6 +121,10 @@ CACHES = {
 }
 
 CACHE_TTL = 60 * 1
+RESPONSE_CACHE_TTL = 60 * 60 * 24
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 60
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
 
@@ -150,14 +178,32 @@ EMAIL_HOST_USER = config('EMAIL_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_PASSWORD')
 EMAIL_PORT = config('EMAIL_PORT')
 EMAIL_USE_TLS = config('USE_TLS', cast=bool)
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = config(
+    'EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=BASE_DIR / 'emails')
+EMAIL_OUTBOX = {
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 60,
+    # Seconds a claimed batch is hidden from other workers while it is sent
+    'CLAIM_TIMEOUT': 5 * 60,
+    # Seconds sent emails are kept before they are purged
+    'KEEP_SENT': 7 * 24 * 60 * 60,
+}
+
+ONE_TIME_TOKEN_TTL = {
+    'ACTIVATION': timedelta(days=3),
+    'PASSWORD_RESTORE': timedelta(hours=1),
+    'ORDER_CONFIRM': timedelta(days=7),
+    'ORDER_COMPLETE': timedelta(days=14),
+}
 
 
 # REST settings
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'knox.auth.TokenAuthentication',
+        'apps.users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -183,6 +229,12 @@ REST_KNOX = {
     'TOKEN_LIMIT_PER_USER': 2,
 }
 
+AUTH_TOKEN_CACHE = {
+    'TTL': 60 * 5,
+    'FLUSH_INTERVAL': 60,
+    'BATCH_SIZE': 100,
+}
+
 
 # Swagger settings
 
@@ -202,11 +254,30 @@ SWAGGER_SETTINGS = {
 CELERY_TIMEZONE = "Asia/Bishkek"
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+# Every worker process holds its own database connection
+CELERY_WORKER_CONCURRENCY = config('CELERY_WORKER_CONCURRENCY', default=4, cast=int)
+CELERY_DB_CONN_MAX_AGE = config('CELERY_DB_CONN_MAX_AGE', default=600, cast=int)
 CELERY_BEAT_SCHEDULE = {
     'run-tests': {
         'task': 'core.celery.run_tests',
         'schedule': crontab(minute=0, hour=0, day_of_week='*/2'),
     },
+    'send-outbox': {
+        'task': 'apps.notifications.tasks.send_outbox',
+        'schedule': timedelta(seconds=10),
+    },
+    'build-recommendations': {
+        'task': 'apps.products.tasks.build_recommendations',
+        'schedule': crontab(minute='*/30'),
+    },
+    'purge-expired-tokens': {
+        'task': 'apps.users.tasks.purge_expired_tokens',
+        'schedule': crontab(minute=0),
+    },
+    'purge-sent-emails': {
+        'task': 'apps.notifications.tasks.purge_sent_emails',
+        'schedule': crontab(minute=30, hour=3),
+    },
 }
 CELERY_BROKER_URL=config('CACHE_LOCATION')
 
@@ -223,6 +294,16 @@ LOGGING = {
             'style': '{',
             'exc_info': False,
         },
+        'json': {
+            '()': 'core.log.JsonFormatter',
+        },
+    },
+
+    'filters': {
+        'activity_sampling': {
+            '()': 'core.log.SamplingFilter',
+            'rate': config('ACTIVITY_LOG_SAMPLE_RATE', default=1.0, cast=float),
+        },
     },
 
     'handlers': {
@@ -235,6 +316,12 @@ LOGGING = {
             'filename': 'info.log',
             'formatter': 'main_formatter',
         },
+        'activity': {
+            'class': 'core.log.QueueListenerHandler',
+            'filename': 'activity.log',
+            'formatter': 'json',
+            'filters': ['activity_sampling'],
+        },
     },
 
     'loggers': {
@@ -244,9 +331,9 @@ LOGGING = {
             'level': 'INFO',
         },
         'user_logger': {
-            'handlers': ['file'],
-            'propagate': True,
-            'level': 'WARNING',
+            'handlers': ['activity'],
+            'propagate': False,
+            'level': 'INFO',
         },
     },
 }
@@ -257,7 +344,34 @@ LOGGING = {
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+PRODUCT_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+PRODUCT_UPLOAD_MEMORY_THRESHOLD = 1024 * 1024
+PRODUCT_UPLOAD_MAX_PIXELS = 40_000_000
+PRODUCT_DETAIL_COMMENTS = 5
+
+RECOMMENDATIONS = {
+    'SIZE': 20,
+    'NEIGHBOURS': 20,
+    'HALF_LIFE_DAYS': 7,
+    'WINDOW_DAYS': 90,
+    'ORDER_WEIGHT': 3,
+    'LIKE_WEIGHT': 1,
+    'TTL': 60 * 60 * 2,
+}
+
+PRODUCT_IMAGE_RENDITIONS = {
+    'thumbnail': (150, 150),
+    'card': (300, 300),
+    'detail': (1200, 1200),
+}
+
 if 'test' in sys.argv:
     MIDDLEWARE.remove('core.middleware.LogUserActivityMiddleware')
+    # A separate, unreplicated database standing in for a replica in
+    # routing tests, DATABASE_REPLICAS stays empty for all other tests
+    DATABASES['replica'] = {**DATABASES['default']}
+    if 'sqlite' not in DATABASES['default']['ENGINE']:
+        DATABASES['replica']['TEST'] = {
+            'NAME': f"test_{DATABASES['default']['NAME']}_replica"}
 
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
@@ -0,0 +1,61 @@
+from functools import cached_property
+
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if not value:
+        # Empty parameters are ignored, as by the response cache key
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldset:
+    """
+    `?fields=` keeps only the listed fields, the id is always kept.
+    `?expand=` nests only the listed relations, the rest are rendered as
+    primary keys, so `?expand=none` nests nothing. Without the parameters
+    everything is nested as before.
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None or request.method not in SAFE_METHODS:
+            return cls()
+        return cls(_names(request, FIELDS_PARAM),
+                   _names(request, EXPAND_PARAM))
+
+    def wants(self, name):
+        return self.fields is None or name == 'id' or name in self.fields
+
+    def expands(self, name):
+        return self.wants(name) and (self.expand is None or
+                                     name in self.expand)
+
+
+class SparseFieldsMixin:
+    """ Applies the request fieldset to the top level serializer only,
+    nested serializers keep all their fields """
+
+    @cached_property
+    def sparse(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return SparseFieldset()
+        return SparseFieldset.from_request(self.context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        return {name: field for name, field in fields.items()
+                if self.sparse.wants(name)}
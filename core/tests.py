@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import resolve
+from knox.models import AuthToken
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APITestCase
+
+from apps.products.models import Category, Product
+
+from .metrics import Histogram
+from .routers import PrimaryReplicaRouter, replica_reads, routing_state
+from .log import JsonFormatter, QueueListenerHandler, SamplingFilter
+from .middleware import LogUserActivityMiddleware
+
+User = get_user_model()
+
+
+class ActivityLogTestCase(TestCase):
+    def test_middleware_logs_structured_activity(self):
+        user = User.objects.create_user(
+            username='testuser', email='test@test.com', password='testpass')
+        request = RequestFactory().get('/products/')
+        request.user = user
+        request.resolver_match = resolve('/products/')
+        middleware = LogUserActivityMiddleware(
+            lambda request: Response(status=200))
+
+        with self.assertLogs('user_logger', 'INFO') as logs:
+            middleware(request)
+
+        entry = json.loads(JsonFormatter().format(logs.records[0]))
+        self.assertEqual(entry['user_id'], user.pk)
+        self.assertEqual(entry['method'], 'GET')
+        self.assertEqual(entry['route'], 'products-list')
+        self.assertEqual(entry['status'], 200)
+        self.assertIn('duration_ms', entry)
+
+
+class SamplingFilterTestCase(SimpleTestCase):
+    def make_record(self, level, status):
+        record = logging.LogRecord(
+            'user_logger', level, __file__, 0, 'request', None, None)
+        record.activity = {'status': status}
+        return record
+
+    def test_errors_are_always_kept(self):
+        sampling = SamplingFilter(rate=0)
+        self.assertFalse(sampling.filter(self.make_record(logging.INFO, 200)))
+        self.assertTrue(sampling.filter(self.make_record(logging.INFO, 500)))
+        self.assertTrue(sampling.filter(self.make_record(logging.WARNING, 200)))
+
+
+class QueueListenerHandlerTestCase(SimpleTestCase):
+    def test_records_are_written_by_listener(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'activity.log')
+            handler = QueueListenerHandler(filename, capacity=10)
+            handler.setFormatter(JsonFormatter())
+            record = logging.LogRecord(
+                'user_logger', logging.INFO, __file__, 0, 'request', None, None)
+            record.activity = {'user_id': 1}
+            handler.handle(record)
+            handler.close()
+
+            with open(filename) as file:
+                entry = json.loads(file.readline())
+        self.assertEqual(entry['user_id'], 1)
+        self.assertEqual(entry['message'], 'request')
+
+    def test_idle_batch_is_flushed_on_time(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'activity.log')
+            handler = QueueListenerHandler(
+                filename, capacity=10, flush_interval=0.05)
+            handler.handle(logging.LogRecord(
+                'user_logger', logging.INFO, __file__, 0, 'request', None, None))
+            for _ in range(100):
+                if os.path.exists(filename) and os.path.getsize(filename):
+                    break
+                time.sleep(0.01)
+            written = os.path.exists(filename) and os.path.getsize(filename)
+            handler.close()
+        self.assertTrue(written)
+
+
+class PerformanceMiddlewareTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/products/')
+        self.assertIn('db;desc="1 queries"', response['Server-Timing'])
+        self.assertIn('cache;desc="0 hits, 1 misses"', response['Server-Timing'])
+
+        response = self.client.get('/products/')
+        self.assertIn('db;desc="0 queries"', response['Server-Timing'])
+
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get(
+                '/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('http_requests_total{route="products-list",'
+                      'action="list",status="200"}', text)
+        self.assertIn('response_cache_hits_total{route="products-list",'
+                      'action="list"}', text)
+
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics/').status_code, 200)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+            response = self.client.get(
+                '/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+    def test_histogram_is_cumulative(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.samples()),
+                         [(1, 2), (5, 3), ('+Inf', 4)])
+        self.assertEqual(histogram.sum, 14)
+
+
+class PrimaryReplicaRouterTestCase(SimpleTestCase):
+    def test_reads_use_replica_only_when_asked(self):
+        router = PrimaryReplicaRouter()
+        with self.settings(DATABASE_REPLICAS=['replica']):
+            self.assertEqual(router.db_for_read(User), 'default')
+            with replica_reads():
+                self.assertEqual(router.db_for_read(User), 'replica')
+                self.assertEqual(router.db_for_write(User), 'default')
+            self.assertEqual(router.db_for_read(User), 'default')
+
+    def test_token_refresh_is_not_a_write(self):
+        router = PrimaryReplicaRouter()
+        with routing_state() as state:
+            router.db_for_write(AuthToken)
+            self.assertFalse(state.wrote)
+            router.db_for_write(User)
+            self.assertTrue(state.wrote)
+
+    def test_replica_is_chosen_once(self):
+        router = PrimaryReplicaRouter()
+        with self.settings(DATABASE_REPLICAS=['replica1', 'replica2']):
+            for _ in range(5):
+                with replica_reads():
+                    self.assertEqual(
+                        len({router.db_for_read(User) for _ in range(20)}), 1)
+
+    def test_no_replicas_configured(self):
+        with self.settings(DATABASE_REPLICAS=[]), replica_reads():
+            self.assertEqual(PrimaryReplicaRouter().db_for_read(User), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(APITestCase):
+    """ The replica is a separate empty database, so rows written to the
+    primary are only visible when a read is routed there """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(
+            username='seller', email='seller@test.com', password='testpass')
+        self.buyer = User.objects.create_user(
+            username='buyer', email='buyer@test.com', password='testpass')
+        self.product = Product.objects.create(
+            title='Test Product', description='Test description',
+            price=10, user=self.seller)
+
+    def test_catalog_reads_use_replica(self):
+        response = self.client.get('/products/')
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(self.client.get('/categories/').status_code, 200)
+
+    def test_writer_is_pinned_to_primary(self):
+        self.client.force_authenticate(self.buyer)
+        response = self.client.post(
+            f'/products/{self.product.id}/comment/', {'text': 'Nice'})
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(f'/products/{self.product.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['comments']), 1)
+
+        cache.clear()
+        anonymous = APIClient()
+        response = anonymous.get(f'/products/{self.product.id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_replica_does_not_cache_over_a_fresh_write(self):
+        category = Category.objects.create(title='Test category')
+        self.client.force_authenticate(self.seller)
+        response = self.client.post('/products/', {
+            'title': 'New Product', 'price': 10,
+            'description': 'Test description', 'categories': category.id})
+        self.assertEqual(response.status_code, 201)
+
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get('/products/').data['results'], [])
+        response = self.client.get('/products/')
+        self.assertEqual(len(response.data['results']), 2)
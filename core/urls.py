@@ -7,6 +7,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from .views import metrics_view
+
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -26,6 +28,7 @@ urlpatterns = [
     path('', schema_view.with_ui('swagger',
          cache_timeout=0), name='schema-swagger-ui'),
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
     path('accounts/', include('apps.users.urls'), name='user accounts api'),
     path('', include('apps.orders.urls')),
     path('', include('apps.products.urls')),
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+
+from .metrics import registry
+
+
+@require_GET
+def metrics_view(request):
+    """ Aggregates of this process for a Prometheus scraper, open
+    without METRICS_TOKEN only in DEBUG """
+    if not settings.METRICS_TOKEN:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(
+            request.headers.get('Authorization', ''),
+            f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')